@@ -0,0 +1,210 @@
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import config
+from datafile import DataFile
+from formats.format import UnrecognizedFormatError, BadFileError
+from functions.time_function import TimeFunction
+import functions
+
+# Headless processing of the files of a project, without opening the application.
+#
+# Usage:
+#   python batch.py path/to/project.json jobs.json [-j WORKERS]
+#
+# The jobs file lists the functions to be calculated on every file and the labels to be added:
+#   {
+#     "functions": [
+#       {"function": "Moving average", "source": "Random A", "name": "MA", "parameters": {"Window size": 10}}
+#     ],
+#     "labels": {
+#       "file.csv": [["Label", 100, 250], ["Label", 900, 1000]]
+#     }
+#   }
+
+
+def get_function(name):
+    for function in TimeFunction.__subclasses__():
+        f = function()
+        if f.get_name() == name:
+            return f
+    return None
+
+
+# Parameters missing from a job take their default value, as in the dialog of the application
+#  (combo boxes give the selected text). Raises ValueError if a parameter is not valid.
+def fill_parameters(function, parameters):
+    filled = {}
+    for key, param in (function.get_parameters() or {}).items():
+        value = parameters.get(key)
+        if param["type"] == "combo":
+            value = param["values"][param["default"]] if value is None else value
+            if value not in param["values"]:
+                raise ValueError("'{}' must be one of {}".format(key, param["values"]))
+        elif param["type"] == "int":
+            value = param["default"] if value is None else value
+            if not isinstance(value, int) or not param["min"] <= value <= param["max"]:
+                raise ValueError("'{}' must be an integer between {} and {}".format(key, param["min"], param["max"]))
+        else:
+            value = str(param.get("default", "")) if value is None else str(value)
+        filled[key] = value
+    return filled
+
+
+# Runs in a worker process: results are reported back instead of being shown.
+# Unexpected errors are reported with the file, so that the other files are processed anyway.
+def process_file(path, labels, file_functions, jobs, label_imports):
+    start = time.time()
+    result = {"path": path, "header": None, "added": [], "rows": 0, "size": 0, "errors": [], "saved": True}
+    try:
+        run_jobs(result, path, labels, file_functions, jobs, label_imports)
+    except Exception as e:
+        result["errors"].append("unexpected error: {!r}".format(e))
+        result["saved"] = False
+    result["time"] = time.time() - start
+    return result
+
+
+def run_jobs(result, path, labels, file_functions, jobs, label_imports):
+    try:
+        result["size"] = os.path.getsize(path)
+        datafile = DataFile(path, labels)
+        datafile.load()  # big files are streamed: the rest of their blocks are read
+    except (OSError, UnrecognizedFormatError, BadFileError):
+        result["errors"].append("unable to read the file")
+        return
+
+    header = datafile.get_data_header()
+    result["header"] = header
+    result["data_columns"] = datafile.get_data_columns()
+    result["rows"] = datafile.get_shape()
+    file_functions = file_functions.get(str(header), [])
+
+    for job in jobs:
+        if job["name"] in header:
+            continue  # already calculated
+        if job["source"] not in header:
+            result["errors"].append("missing source '{}' for '{}'".format(job["source"], job["name"]))
+            continue
+
+        function = get_function(job["function"])
+        source = datafile.get_data_columns()[datafile.get_data_header().index(job["source"])]
+        ts = datafile.get_series_to_process(source, job["name"])
+        fs = function.process_series(ts, job["parameters"])
+        if fs is None:
+            result["errors"].append("unable to calculate '{}'".format(job["name"]))
+            continue
+
+        datafile.add_function(fs)
+        result["added"].append(fs.name)
+
+    n_rows = datafile.get_shape()
+    for name, a, b in label_imports:
+        a, b = max(int(a), 0), min(int(b), n_rows - 1)
+        if name not in labels or a > b:
+            result["errors"].append("invalid label {}".format([name, a, b]))
+            continue
+        datafile.label_store.insert(name, a, b)
+
+    if result["added"] or label_imports:
+        datafile.save(file_functions + result["added"])
+        if not config.wait_saves():
+            result["errors"].append("unable to write the file")
+            result["saved"] = False
+
+
+# Same changes applied by ProjectData when functions are added from the application
+def update_project(project, result):
+    header = result["header"]
+    if str(header) not in project:
+        project[str(header)] = {
+            "plot": [[i] for i in result["data_columns"]],
+            "normalize": [],
+            "functions": []
+        }
+    if not result["added"]:
+        return
+
+    new_header = header + result["added"]
+    project[str(new_header)] = project[str(header)]
+    for name in result["added"]:
+        if name not in project[str(new_header)]["functions"]:
+            project[str(new_header)]["functions"].append(name)
+
+
+def read_jobs(path):
+    jobs = config.read_json(path)
+    if jobs is None:
+        return None, None
+
+    for job in jobs.get("functions", []):
+        missing = [key for key in ("function", "source", "name") if key not in job]
+        if missing:
+            print("Invalid job {}: missing {}".format(job, ", ".join(missing)))
+            return None, None
+        function = get_function(job["function"])
+        if function is None:
+            print("Unknown function: {}".format(job["function"]))
+            return None, None
+        try:
+            job["parameters"] = fill_parameters(function, job.get("parameters", {}))
+        except ValueError as e:
+            print("Invalid parameters of '{}': {}".format(job["name"], e))
+            return None, None
+    return jobs.get("functions", []), jobs.get("labels", {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process the files of a TSL project without the GUI")
+    parser.add_argument("project", help="project configuration (project.json)")
+    parser.add_argument("jobs", help="functions and labels to apply (JSON)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    args = parser.parse_args()
+
+    project = config.read_json(args.project)
+    jobs, label_imports = read_jobs(args.jobs)
+    if project is None or jobs is None:
+        return 2
+
+    folder = os.path.dirname(args.project)
+    files = project["files"]
+    file_functions = {key: conf["functions"] for key, conf in project.items() if key.startswith('[')}
+    n_failed = n_rows = n_bytes = 0
+    start = time.time()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(process_file, os.path.join(folder, file), project["labels"], file_functions,
+                                   jobs, label_imports.get(file, [])): file for file in files}
+
+        for i, future in enumerate(as_completed(futures)):
+            try:
+                result = future.result()
+            except Exception as e:  # the worker process itself has failed
+                result = {"path": os.path.join(folder, futures[future]), "header": None, "time": 0,
+                          "errors": ["worker failed: {!r}".format(e)]}
+            name = os.path.relpath(result["path"], folder)
+            status = "; ".join(result["errors"]) if result["errors"] else "ok"
+            print("[{:>{w}}/{}] {} ({:.2f} s): {}".format(i + 1, len(files), name, result["time"], status,
+                                                         w=len(str(len(files)))))
+
+            # The project is not updated with the functions of files which have not been written
+            if result["header"] is None or not result["saved"]:
+                n_failed += 1
+                continue
+            update_project(project, result)
+            n_rows += result["rows"]
+            n_bytes += result["size"]
+
+    elapsed = time.time() - start
+    if not config.write_json(project, args.project):
+        return 2
+
+    print("Processed {} files ({} failed) in {:.2f} s".format(len(files) - n_failed, n_failed, elapsed))
+    print("Throughput: {:.0f} rows/s, {:.2f} MB/s".format(n_rows / elapsed, n_bytes / 2**20 / elapsed))
+    return 1 if n_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pyramid import Pyramid
+from plotter import sample_series, sample_range
+from sampler import Sampler, WORKERS
+
+# Scaling of a redraw: time taken to index and downsample all the columns of the plots, one
+#  column after the other as the previous sequential path did, and in a single batch on the
+#  worker pool. The first draw builds the pyramids of the columns, the zoomed view reuses them.
+#  The points are checked to be identical.
+#
+# Usage:
+#   python benchmarks/downsample.py [-n ROWS] [-c COLUMNS] [-w WORKERS]
+
+
+def make_columns(n_rows, n_columns):
+    rng = np.random.default_rng(0)
+    columns = []
+    for _ in range(n_columns):
+        values = np.cumsum(rng.standard_normal(n_rows))
+        values[rng.integers(0, n_rows, n_rows // 1000)] = np.nan
+        columns.append(values)
+    return columns
+
+
+# Previous path: each column is indexed (if needed) and sampled in turn, on the calling thread
+def sequential(columns, pyramids, a, b):
+    if not pyramids:
+        pyramids.extend(Pyramid(values) for values in columns)
+    return [sample_series(pyr, a, b) for pyr in pyramids]
+
+
+def batch(columns, pyramids, a, b, pool):
+    if not pyramids:
+        pyramids.extend(pool.map(Pyramid, columns))
+    return sample_range(pyramids, a, b, pool=pool)
+
+
+def measure(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        points = function()
+    return (time.perf_counter() - start) / repeat, points
+
+
+def same_points(points, other):
+    return all(np.array_equal(x1, x2) and np.array_equal(y1, y2, equal_nan=True)
+               for (x1, y1), (x2, y2) in zip(points, other))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexing and downsampling of a redraw, sequential and on the pool")
+    parser.add_argument("-n", "--rows", type=int, default=2000000)
+    parser.add_argument("-c", "--columns", type=int, default=40)
+    parser.add_argument("-w", "--workers", type=int, default=WORKERS)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    columns = make_columns(args.rows, args.columns)
+    pool = Sampler(args.workers)
+    views = [("first draw", 0, args.rows, True), ("zoom 10%", int(args.rows * 0.45), int(args.rows * 0.55), False)]
+    seq_pyramids, pool_pyramids = [], []
+
+    print("{} columns x {} rows, {} workers".format(args.columns, args.rows, pool.workers))
+    for name, a, b, build in views:
+        def run_sequential():
+            if build:
+                seq_pyramids.clear()
+            return sequential(columns, seq_pyramids, a, b)
+
+        def run_pool():
+            if build:
+                pool_pyramids.clear()
+            return batch(columns, pool_pyramids, a, b, pool)
+
+        one, one_points = measure(run_sequential, args.repeat)
+        many, many_points = measure(run_pool, args.repeat)
+        if not same_points(one_points, many_points):
+            print("Points differ!")
+            return 1
+        print("{:>10}: sequential {:6.3f} s, pool {:6.3f} s, speedup {:.1f}x".format(name, one, many, one / many))
+
+    pool.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
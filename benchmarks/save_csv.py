@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from labels import LabelStore
+from formats.csv_format import BLOCK_ROWS
+from formats.csv_writer import open_output, write_csv
+
+# Throughput of the CSV writer compared with writing the same blocks through DataFrame.to_csv
+#  (the previous implementation). The outputs are checked to be identical.
+#
+# Usage:
+#   python benchmarks/save_csv.py [-n ROWS] [-c COLUMNS]
+
+
+def make_columns(n_rows, n_columns):
+    rng = np.random.default_rng(0)
+    stamps = pd.date_range("2020-01-01", periods=n_rows, freq="10ms").strftime("%Y-%m-%d %H:%M:%S.%f")
+    columns = [("Timestamp", stamps.to_numpy(dtype=str))]
+    for i in range(n_columns):
+        values = np.cumsum(rng.standard_normal(n_rows))
+        values[rng.integers(0, n_rows, n_rows // 1000)] = np.nan
+        columns.append(("Signal {}".format(i), values))
+    columns.append(("Counter", np.arange(n_rows)))
+
+    label_store = LabelStore()
+    for name in ("Walk", "Run"):
+        starts = np.sort(rng.integers(0, n_rows, n_rows // 10000))
+        label_store.extend(name, starts, np.minimum(starts + rng.integers(10, 2000, starts.shape[0]), n_rows - 1))
+    return columns + label_store.get_columns(n_rows)
+
+
+def write_pandas(columns, filename):
+    n_rows = len(columns[0][1])
+    with open(filename, 'w', encoding='utf-8', newline='') as out_file:
+        for start in range(0, n_rows, BLOCK_ROWS):
+            stop = start + BLOCK_ROWS
+            block = pd.DataFrame({i: values[start:stop] for i, (_, values) in enumerate(columns)}, copy=False)
+            block.columns = [name for name, _ in columns]
+            block.to_csv(out_file, sep=',', index=False, header=start == 0)
+
+
+def write_fast(columns, filename, compression=None):
+    with open_output(filename, compression) as out_file:
+        write_csv(columns, out_file, BLOCK_ROWS)
+
+
+def measure(write, filename, size=None):
+    start = time.perf_counter()
+    write(filename)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(filename) if size is None else size
+    return elapsed, size / 2**20 / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSV writer throughput")
+    parser.add_argument("-n", "--rows", type=int, default=1000000)
+    parser.add_argument("-c", "--columns", type=int, default=6, help="number of float columns")
+    args = parser.parse_args()
+
+    columns = make_columns(args.rows, args.columns)
+    with tempfile.TemporaryDirectory() as folder:
+        old, new = os.path.join(folder, "old.csv"), os.path.join(folder, "new.csv")
+        results = [("to_csv", measure(lambda f: write_pandas(columns, f), old)),
+                   ("writer", measure(lambda f: write_fast(columns, f), new))]
+        with open(old, 'rb') as a, open(new, 'rb') as b:
+            if a.read() != b.read():
+                print("Outputs differ!")
+                return 1
+
+        size = os.path.getsize(new)
+        for compression in ("gzip", "zstd"):
+            try:
+                path = os.path.join(folder, "new.csv." + compression)
+                results.append(("writer+" + compression,
+                                measure(lambda f: write_fast(columns, f, compression), path, size)))
+            except ImportError:
+                print("{} not available".format(compression))
+
+    print("{} rows, {:.1f} MB of text".format(args.rows, size / 2**20))
+    for name, (elapsed, speed) in results:
+        print("{:>12}: {:6.2f} s, {:7.1f} MB/s".format(name, elapsed, speed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from labels import LabelStore
+
+VERSION = 5
+META = "meta.json"
+TIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%d"]
+
+
+# Column store of a parsed data file: each column is a raw binary file in a folder next
+#  to the original (labels are kept in the metadata as intervals). Columns are memory
+#  mapped, so only the pages which are actually used are read from disk, and the copy
+#  is discarded as soon as the size or the modification time of the original file change.
+# Timestamps written as text are stored parsed (datetime64) with the format giving back the
+#  same text, other text columns are not stored.
+def get_path(filename):
+    return filename + ".cache"
+
+
+def get_stamp(filename):
+    stat = os.stat(filename)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def map_column(path, dtype, rows, offset=0):
+    if rows == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(rows,))
+
+
+def read_meta(folder):
+    with open(os.path.join(folder, META)) as in_file:
+        return json.load(in_file)
+
+
+# The copy is valid only once its metadata exist, so they are replaced in a single step
+def write_meta(folder, meta):
+    with open(os.path.join(folder, META + ".tmp"), 'w') as out_file:
+        json.dump(meta, out_file)
+    os.replace(os.path.join(folder, META + ".tmp"), os.path.join(folder, META))
+
+
+def load(filename, labels):
+    folder = get_path(filename)
+    try:
+        meta = read_meta(folder)
+        if meta["version"] != VERSION or meta["source"] != get_stamp(filename) or meta["labels"] != labels:
+            return None
+
+        columns = {}
+        for i, dtype in enumerate(meta["dtypes"]):
+            columns[i] = map_column(os.path.join(folder, "{}.bin".format(i)), np.dtype(dtype), meta["rows"])
+    except (IOError, ValueError, KeyError, TypeError):
+        return None
+
+    # Series derived in a previous session are no longer used
+    try:
+        remove_derived(folder, meta, meta["derived"])
+    except IOError:
+        pass
+
+    df = pd.DataFrame(columns, index=pd.RangeIndex(meta["rows"]), copy=False)
+    df.columns = meta["columns"]
+    time_formats = {name: f for name, f in zip(meta["columns"], meta["time_formats"]) if f is not None}
+    return df, LabelStore.from_list(meta["label_store"]), time_formats
+
+
+# Only numeric columns, dates and timestamps written as text (in one of the known formats) can be
+#  stored. Returns the values and the format of the text (None for the other columns), or None.
+def to_array(col, time_format=None):
+    if col.dtype.kind in 'biuf' or (col.dtype.kind == 'M' and isinstance(col.dtype, np.dtype)):
+        return col.to_numpy(), None
+    if pd.api.types.infer_dtype(col, skipna=False) == "string":
+        for f in (TIME_FORMATS if time_format is None else [time_format]):
+            try:
+                parsed = pd.to_datetime(col, format=f)
+            except (ValueError, TypeError):
+                continue
+            if (parsed.dt.strftime(f) == col).all():
+                return parsed.to_numpy(), f
+    return None
+
+
+# Stored timestamps are written back as the text they were parsed from, block by block
+class TextColumn:
+    dtype = np.dtype('U')
+
+    def __init__(self, values, time_format):
+        self.values = values
+        self.time_format = time_format
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, rows):
+        return pd.DatetimeIndex(self.values[rows]).strftime(self.time_format).to_numpy(dtype=str)
+
+
+# Derived series (functions) are stored too, so that they are memory mapped like the other columns.
+# They are recorded in the metadata and removed with their function, or when the copy is opened
+#  again (functions are then computed again or read from the delta).
+# Returns the file and the mapped values, or None if the series can't be stored.
+def store_column(filename, values):
+    folder = get_path(filename)
+    values = np.asarray(values)
+    try:
+        meta = read_meta(folder)
+        k = 0
+        while os.path.exists(os.path.join(folder, "derived-{}.bin".format(k))):
+            k += 1
+        file = "derived-{}.bin".format(k)
+        values.tofile(os.path.join(folder, file))
+        meta["derived"].append(file)
+        write_meta(folder, meta)
+    except (IOError, ValueError, KeyError):
+        return None
+    return file, map_column(os.path.join(folder, file), values.dtype, values.shape[0])
+
+
+def remove_column(filename, file):
+    folder = get_path(filename)
+    try:
+        remove_derived(folder, read_meta(folder), [file])
+    except (IOError, ValueError, KeyError):
+        pass
+
+
+# Files which can't be removed yet (e.g. still mapped on Windows) are kept in the metadata
+def remove_derived(folder, meta, files):
+    if not files:
+        return
+
+    kept = []
+    for file in meta["derived"]:
+        try:
+            if file in files:
+                os.remove(os.path.join(folder, file))
+                continue
+        except FileNotFoundError:
+            continue
+        except OSError:
+            pass
+        kept.append(file)
+    meta["derived"] = kept
+    write_meta(folder, meta)
+
+
+# Writes a file block by block (as it's read), the meta data are written once it's complete.
+# The labels of the file are kept apart, since the ones of the DataFile can be edited meanwhile.
+class Writer:
+    def __init__(self, filename, labels, label_store):
+        self.filename = filename
+        self.labels = labels
+        self.label_store = LabelStore.from_list(label_store.to_list())
+        self.folder = get_path(filename)
+        self.columns = None
+        self.time_formats = None
+        self.blocks = []  # rows, dtypes and offsets of each block
+        self.rows = 0
+
+        # The old copy is invalidated before removing it. Raises OSError if it can't be removed
+        #  (e.g. its columns are still mapped), since its files would be mixed with the new ones.
+        if os.path.exists(self.folder):
+            if os.path.exists(os.path.join(self.folder, META)):
+                os.remove(os.path.join(self.folder, META))
+            shutil.rmtree(self.folder)
+        os.makedirs(self.folder, exist_ok=True)
+
+    def get_column_path(self, i):
+        return os.path.join(self.folder, "{}.bin".format(i))
+
+    # Returns the block backed by the stored copy, or None if it can't be stored. Timestamps
+    #  written as text are kept as they are: the parsed ones are mapped once the file is complete.
+    def append(self, df):
+        if self.columns is not None and df.shape[1] != len(self.columns):
+            return None
+        formats = self.time_formats or [None] * df.shape[1]
+        stored = [to_array(df.iloc[:, i], formats[i]) for i in range(df.shape[1])]
+        if any(s is None for s in stored):
+            return None
+
+        arrays = [a for a, _ in stored]
+        if self.columns is None:
+            self.columns = [str(c) for c in df.columns]
+            self.time_formats = [f for _, f in stored]
+        offsets = []
+        try:
+            for i, a in enumerate(arrays):
+                with open(self.get_column_path(i), 'ab' if self.blocks else 'wb') as out_file:
+                    offsets.append(out_file.tell())
+                    a.tofile(out_file)
+        except IOError:
+            return None
+
+        self.blocks.append((df.shape[0], [a.dtype for a in arrays], offsets))
+        self.rows += df.shape[0]
+
+        columns = {}
+        for i, (a, offset) in enumerate(zip(arrays, offsets)):
+            if self.time_formats[i] is None:
+                columns[i] = map_column(self.get_column_path(i), a.dtype, a.shape[0], offset)
+            else:
+                columns[i] = df.iloc[:, i]
+        block = pd.DataFrame(columns, index=df.index, copy=False)
+        block.columns = df.columns
+        return block
+
+    # Blocks may have different types (e.g. NaNs in a column of integers): columns are converted
+    #  to a common one (numbers and dates have none). Returns the whole memory mapped DataFrame
+    #  and the formats of its timestamps, or None if it can't be stored.
+    def finish(self):
+        try:
+            dtypes = []
+            for i in range(len(self.columns)):
+                dtypes.append(np.result_type(*[b[1][i] for b in self.blocks]))
+                if any(b[1][i] != dtypes[i] for b in self.blocks):
+                    self.convert(i, dtypes[i])
+
+            # Written last: the copy is valid only if the metadata exist
+            meta = {
+                "version": VERSION,
+                "source": get_stamp(self.filename),
+                "rows": self.rows,
+                "columns": self.columns,
+                "dtypes": [d.str for d in dtypes],
+                "labels": self.labels,
+                "label_store": self.label_store.to_list(),
+                "time_formats": self.time_formats,
+                "derived": []
+            }
+            write_meta(self.folder, meta)
+        except (IOError, TypeError):
+            self.discard()
+            return None
+
+        loaded = load(self.filename, self.labels)
+        return None if loaded is None else (loaded[0], loaded[2])
+
+    def convert(self, i, dtype):
+        path = self.get_column_path(i)
+        with open(path + ".tmp", 'wb') as out_file:
+            for rows, dtypes, offsets in self.blocks:
+                col = np.memmap(path, dtype=dtypes[i], mode='r', offset=offsets[i], shape=(rows,))
+                col.astype(dtype).tofile(out_file)
+        os.replace(path + ".tmp", path)
+
+    def discard(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
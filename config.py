@@ -1,7 +1,9 @@
 import os
 import json
 import logging
-from datafile import DataFile
+from datafile import DataFile, TIMESTAMP
+from prefetch import Prefetcher, get_neighbours
+from saver import Saver, replace_file
 from formats.format import *
 import dialogs
 
@@ -20,6 +22,8 @@ class FilesData:
 
         self.datafile = None
         self.config = None
+        self.prefetcher = Prefetcher(get_prefetch_memory())
+        self.pending = {}  # files whose changes have been saved as a delta: path -> labels
         self.init()
         self.read()
 
@@ -43,6 +47,7 @@ class FilesData:
             self.read_file()
             self.config["plot"] = [[i] for i in self.datafile.get_data_columns()]
             self.config["normalize"] = []
+            self.config["m4"] = []
             self.config["functions"] = []
 
         if self.current_label >= len(self.config["labels"]):
@@ -51,6 +56,7 @@ class FilesData:
 
     def read_conf(self):
         conf_path = self.config_list[self.current_file]
+        saver.wait(conf_path)
         try:
             with open(conf_path) as in_file:
                 self.config = json.load(in_file)
@@ -70,7 +76,10 @@ class FilesData:
             return
 
         try:
-            self.datafile = DataFile(current, self.config["labels"])
+            saver.wait(current)
+            self.datafile = self.prefetcher.take(current, self.config["labels"])
+            if self.datafile is None:
+                self.datafile = DataFile(current, self.config["labels"], column_selector(self.config))
         except (UnrecognizedFormatError, BadFileError):
             self.datafile = None
             self.bad_files.append(current)
@@ -78,19 +87,39 @@ class FilesData:
 
             self.next_file()
             self.read_file()
+            return
+
+        self.prefetch()
+
+    def prefetch(self):
+        # Each file could use different labels, so they are taken from its configuration
+        requests = []
+        for i in get_neighbours(self.current_file, len(self.files_list), get_prefetch_depth()):
+            file = self.files_list[i]
+            if file not in self.bad_files:
+                conf = read_json(self.config_list[i]) if self.config_list[i] else None
+                labels = conf["labels"] if conf else ["Label"]
+                requests.append((file, labels, column_selector(conf)))
+        self.prefetcher.prefetch(requests)
+
+    def save_file(self, compact=True):
+        path = self.files_list[self.current_file]
+        if compact:
+            self.datafile.save()
+            self.pending.pop(path, None)
+        else:
+            self.datafile.save_delta()
+            self.pending[path] = self.config["labels"]
 
-    def save_file(self):
-        self.datafile.save()
+    def compact(self):
+        for path, labels in self.pending.items():
+            compact_file(path, labels)
+        self.pending = {}
 
     def save_config(self):
         if self.modified:
             conf_path = self.files_list[self.current_file] + ".json"
-            try:
-                with open(conf_path, 'w') as out_file:
-                    json.dump(self.config, out_file)
-            except IOError:
-                logger.error("Unable to write {}: permission denied".format(conf_path))
-                exit(2)
+            save_json(self.config, conf_path)
             self.config_list[self.current_file] = conf_path
             self.modified = False
 
@@ -129,6 +158,13 @@ class FilesData:
         self.config["normalize"] = normalize
         self.modified = True
 
+    def get_m4_plots(self):
+        return self.config.get("m4", [])
+
+    def set_m4_plots(self, m4):
+        self.config["m4"] = m4
+        self.modified = True
+
     def next_file(self):
         self.current_file = (self.current_file + 1) % len(self.files_list)
 
@@ -172,6 +208,8 @@ class ProjectData:
 
         self.datafile = None
         self.config = None
+        self.prefetcher = Prefetcher(get_prefetch_memory())
+        self.pending = {}  # files whose changes have been saved as a delta: path -> labels
         self.read_conf()
         self.read_file()
 
@@ -185,6 +223,7 @@ class ProjectData:
             self.current_label = 0
 
     def read_conf(self):
+        saver.wait(self.project_file)
         try:
             with open(self.project_file) as in_file:
                 self.config = json.load(in_file)
@@ -210,7 +249,10 @@ class ProjectData:
             return
 
         try:
-            self.datafile = DataFile(file_path, self.config["labels"])
+            saver.wait(file_path)
+            self.datafile = self.prefetcher.take(file_path, self.config["labels"])
+            if self.datafile is None:
+                self.datafile = DataFile(file_path, self.config["labels"], project_column_selector(self.config))
             self.insert_header()
         except (UnrecognizedFormatError, BadFileError):
             self.datafile = None
@@ -218,6 +260,18 @@ class ProjectData:
             dialogs.notify_read_error(current)
             self.next_file()
             self.read_file()
+            return
+
+        self.prefetch()
+
+    def prefetch(self):
+        requests = []
+        for i in get_neighbours(self.current_file, len(self.config["files"]), get_prefetch_depth()):
+            file = self.config["files"][i]
+            if file not in self.bad_files:
+                requests.append((os.path.join(self.folder, file), self.config["labels"],
+                                 project_column_selector(self.config)))
+        self.prefetcher.prefetch(requests)
 
     def insert_header(self):
         header = self.datafile.get_data_header()
@@ -225,22 +279,29 @@ class ProjectData:
             self.config[str(header)] = {
                 "plot": [[i] for i in self.datafile.get_data_columns()],
                 "normalize": [],
+                "m4": [],
                 "functions": []
             }
             self.modified = True
             self.save_config()
 
-    def save_file(self):
-        self.datafile.save()
+    def save_file(self, compact=True):
+        path = os.path.join(self.folder, self.config["files"][self.current_file])
+        if compact:
+            self.datafile.save()
+            self.pending.pop(path, None)
+        else:
+            self.datafile.save_delta()
+            self.pending[path] = self.config["labels"]
+
+    def compact(self):
+        for path, labels in self.pending.items():
+            compact_file(path, labels)
+        self.pending = {}
 
     def save_config(self):
         if self.modified:
-            try:
-                with open(self.project_file, 'w') as out_file:
-                    json.dump(self.config, out_file)
-            except IOError:
-                logger.error("Unable to write {}: permission denied".format(self.project_file))
-                exit(2)
+            save_json(self.config, self.project_file)
             self.modified = False
 
     def next_label(self):
@@ -282,6 +343,15 @@ class ProjectData:
         conf["normalize"] = normalize
         self.modified = True
 
+    def get_m4_plots(self):
+        header = self.datafile.get_data_header()
+        return self.config[str(header)].get("m4", [])
+
+    def set_m4_plots(self, m4):
+        header = self.datafile.get_data_header()
+        self.config[str(header)]["m4"] = m4
+        self.modified = True
+
     def next_file(self):
         self.current_file = (self.current_file + 1) % len(self.config["files"])
 
@@ -323,7 +393,8 @@ class Config:
     def __init__(self):
         self.path = None
         self.config = None
-        self.default = {"autosave": False, "plot_height": 1.06}
+        self.default = {"autosave": False, "plot_height": 1.06, "prefetch_depth": 1, "prefetch_memory": 1024,
+                        "binary_cache": False, "stream_threshold": 256, "points_per_pixel": 4}
         self.init()
 
     def init(self):
@@ -362,6 +433,32 @@ class Config:
         write_json(self.config, self.path)
 
 
+# Columns read as soon as a file is opened: the ones plotted and the functions of its configuration
+#  (all of them if it has none yet). The others are read when they are plotted.
+def get_eager_columns(conf, header):
+    if not conf or "plot" not in conf:
+        return None
+    names = [header[j] for plot in conf["plot"] for j in plot if j < len(header)]
+    return names + conf["functions"]
+
+
+def column_selector(conf):
+    return lambda header: get_eager_columns(conf, header)
+
+
+# Projects keep a configuration for each header (timestamps excluded)
+def project_column_selector(project):
+    return lambda header: get_eager_columns(project.get(str([key for key in header if key != TIMESTAMP])), header)
+
+
+# Writes into a file the changes saved as a delta (its columns are kept in their order)
+def compact_file(path, labels):
+    try:
+        DataFile(path, labels).save([])
+    except (OSError, UnrecognizedFormatError, BadFileError):
+        logger.error("Unable to write the changes of {}".format(path))
+
+
 def read_json(path):
     try:
         with open(path) as in_file:
@@ -373,23 +470,44 @@ def read_json(path):
 
 
 def write_json(data, path):
-    try:
-        with open(path, 'w') as out_file:
+    def write(tmp):
+        with open(tmp, 'w') as out_file:
             json.dump(data, out_file)
-            return True
+
+    try:
+        replace_file(path, write)
+        return True
     except IOError:
         logger.error("Unable to write {}: permission denied".format(path))
         return False
 
 
+# Written by the saver thread, from a snapshot of the data
+def save_json(data, path):
+    text = json.dumps(data)
+
+    def write(tmp):
+        with open(tmp, 'w') as out_file:
+            out_file.write(text)
+
+    saver.submit(path, "config", lambda: replace_file(path, write))
+
+
 def start_session(files=None, project=None):
     global data_config
+    end_session()
     if files:
         data_config = FilesData(files)
     elif project:
         data_config = ProjectData(project)
 
 
+# Files still being prefetched for the previous session are no longer needed
+def end_session():
+    if data_config is not None:
+        data_config.prefetcher.shutdown()
+
+
 def get_files_list(folder):
     files_list = []
     format_list = get_all_formats()
@@ -434,6 +552,7 @@ except IOError:
         os.makedirs(os.path.dirname(ALT_LOG))
     logger = init_logger(ALT_LOG)
 
+saver = Saver(logger)
 tsl_config = Config()
 data_config = None
 
@@ -459,11 +578,40 @@ def get_plot_height():
     return tsl_config.config["plot_height"]
 
 
-def set_tsl_config(autosave=None, plot_height=None):
+# Number of files read in advance in each direction
+def get_prefetch_depth():
+    return tsl_config.config.get("prefetch_depth", tsl_config.default["prefetch_depth"])
+
+
+# Memory (in bytes) that prefetched files can occupy
+def get_prefetch_memory():
+    return tsl_config.config.get("prefetch_memory", tsl_config.default["prefetch_memory"]) * 2**20
+
+
+# Parsed files are stored as binary columns, which are memory mapped instead of read
+def get_binary_cache():
+    return tsl_config.config.get("binary_cache", tsl_config.default["binary_cache"])
+
+
+# Files bigger than this (in bytes) are read in blocks, plotting them while they are loaded
+def get_stream_threshold():
+    return tsl_config.config.get("stream_threshold", tsl_config.default["stream_threshold"]) * 2**20
+
+
+# Points drawn for each pixel across a plot (M4 needs 4 to keep the extremes of every pixel column)
+def get_points_per_pixel():
+    return tsl_config.config.get("points_per_pixel", tsl_config.default["points_per_pixel"])
+
+
+def set_tsl_config(autosave=None, plot_height=None, binary_cache=None, points_per_pixel=None):
     if autosave is not None:
         tsl_config.config["autosave"] = autosave
     if plot_height is not None:
         tsl_config.config["plot_height"] = plot_height
+    if binary_cache is not None:
+        tsl_config.config["binary_cache"] = binary_cache
+    if points_per_pixel is not None:
+        tsl_config.config["points_per_pixel"] = points_per_pixel
 
 
 def save_tsl_config():
@@ -503,6 +651,15 @@ def set_plot_info(plot_set, normalize):
     data_config.set_plot_info(plot_set, normalize)
 
 
+# Plots downsampled keeping the minimum and maximum of each pixel column (M4) instead of LTTB
+def get_m4_plots():
+    return data_config.get_m4_plots()
+
+
+def set_m4_plots(m4):
+    data_config.set_m4_plots(m4)
+
+
 def set_labels_info(names, colors):
     data_config.set_labels_info(names, colors)
 
@@ -515,8 +672,24 @@ def save_data_config():
     data_config.save_config()
 
 
-def save_file():
-    data_config.save_file()
+def save_file(compact=True):
+    data_config.save_file(compact)
+
+
+# Pending deltas must be written before the files are read and compacted
+def compact_files():
+    saver.wait()
+    data_config.compact()
+    saver.wait()
+
+
+def queue_save(path, kind, job):
+    saver.submit(path, kind, job)
+
+
+# Returns False if a write has failed (the error has been logged)
+def wait_saves(path=None):
+    return saver.wait(path)
 
 
 def next_file():
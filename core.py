@@ -1,4 +1,4 @@
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QIcon, QColor, QPixmap
 from PyQt5.QtWidgets import QSizePolicy, QPushButton, QWidget
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
@@ -6,98 +6,241 @@ from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as Navigatio
 from matplotlib.figure import Figure
 from matplotlib.gridspec import GridSpec
 from matplotlib.colors import to_hex
-import matplotlib.dates as mdates
 
-from plotter import Plotter, get_nearest_index
+from plotter import Plotter, N_MAX, get_nearest_index, get_row_range, index_to_date, sample_range, sampler
+from downsampling import LTTB, M4
+from labels import IntervalIndex
 from popup import RightClickMenu
 import config
 import dialogs
 
 MOUSE_RIGHT = 3
 MOUSE_LEFT = 1
+MARGIN = 2  # plots out of view (on each side) whose data are prepared in advance
+MIN_POINTS = 100  # points drawn for each series, however narrow the plots are
 
 
-# Implements the core functions of the application
+# Implements the core functions of the application.
+# Only the plots which fit the view are drawn: subplots (one for each visible plot) are reused
+#  for the other plots while scrolling, so the figure never grows with the number of plots.
 class PlotCore:
     def __init__(self, plot_canvas):
         self.canvas = plot_canvas
         self.figure = plot_canvas.figure
 
         self.subplots = []
-        self.plotters = []
+        self.plotters = []  # one for each subplot
+        self.first = 0  # index of the plot shown by the first subplot
+        self.views = {}  # plot index -> x limits, for the plots zoomed and scrolled out of view
+        self.default_views = []  # x limits of each subplot when its plot is shown
+        self.n_max = N_MAX  # points drawn for each series, depending on the width of the plots
         self.timestamp = None
+        self.label_index = IntervalIndex()  # plot coordinates of the labels, shared by all plotters
 
     def clear(self):
         for plot in self.subplots:
             self.figure.delaxes(plot)
         del self.subplots[:]
         del self.plotters[:]
+        del self.default_views[:]
+        self.label_index = IntervalIndex()
 
     def redraw(self):
-        self.clear()
         self.plot()
 
     def reset(self):
         config.read_data_config()
+        self.first = 0
         self.redraw()
 
     def plot(self):
+        datafile = config.get_datafile()
+        self.timestamp = datafile.get_plot_dates()
+        self.views = {}
+        self.clear()
+        self.build()
+        self.canvas.refresh()
+
+        # Big files are shown while they are read
+        if not datafile.is_loaded():
+            self.canvas.loader.start()
+
+    # As many plots as they fit the view are shown, none of them lower than the configured height
+    def get_layout(self):
+        plot_set, _ = config.get_plot_info()
+        n_slots = min(len(plot_set), max(1, int(self.figure.get_figheight() / config.get_plot_height())))
+        first = max(0, min(self.first, len(plot_set) - n_slots))
+        return n_slots, first
+
+    def build(self):
+        n_slots, self.first = self.get_layout()
+        if n_slots > 0:
+            grid = GridSpec(n_slots, 1, left=0.08, right=0.92, top=0.99, bottom=0.04, hspace=0.1)
+            for i in range(n_slots):
+                self.subplots.append(self.figure.add_subplot(grid[i]))
+                self.plotters.append(None)
+                self.default_views.append(None)
+        self.n_max = self.get_n_max()
+        self.fill()
+
+    # As many points as the physical pixels across the plots (Qt sizes don't include the device
+    #  pixel ratio), times the configured factor
+    def get_n_max(self):
+        if not self.subplots:
+            return N_MAX
+        width = self.subplots[0].get_position().width * self.canvas.width() * self.canvas.devicePixelRatioF()
+        return max(MIN_POINTS, int(width * config.get_points_per_pixel()))
+
+    # Subplots are cleared and given the plots from the first one on
+    def fill(self):
         datafile = config.get_datafile()
         plot_set, normalize = config.get_plot_info()
-        header = list(datafile.df)
+        self.canvas.set_scroll(self.first, len(plot_set) - len(self.subplots), len(self.subplots))
+
+        # The series of all the plots are indexed and sampled together
+        indexes = range(self.first, self.first + len(self.subplots))
+        pyramids = iter(datafile.get_pyramids([j for index in indexes for j in plot_set[index]], sampler))
+        pyramid_sets = [[next(pyramids) for _ in plot_set[index]] for index in indexes]
+        methods = [M4 if index in config.get_m4_plots() else LTTB for index in indexes]
+        point_sets = self.sample_points(pyramid_sets, methods, 0, datafile.get_shape())
+
+        for i, subplot in enumerate(self.subplots):
+            index = self.first + i
+            draw_set = [datafile.get_series(j) for j in plot_set[index]]
+
+            subplot.cla()
+            subplot.get_yaxis().set_visible(True)
+            plotter = Plotter(subplot, draw_set, pyramid_sets[i], self.timestamp, bool(index in normalize),
+                              methods[i], self.n_max, point_sets[i])
+            self.plotters[i] = plotter
+
+            subplot.set_xticklabels([]) if i < len(self.subplots)-1 else None
+            subplot.legend(loc=1, prop={'size': 8}) if draw_set else None
+            self.default_views[i] = subplot.get_xlim()
+            if index in self.views and not plotter.is_empty():
+                subplot.set_xlim(self.views.pop(index))
+                plotter.resample()
+
+        self.manage_empty()
+        self.insert_labels()
+        QTimer.singleShot(0, self.prepare_margin)
 
-        n_sub = len(plot_set)
-        grid = GridSpec(n_sub, 1, left=0.08, right=0.92, top=0.99, bottom=0.04, hspace=0.1)
-        self.timestamp = [mdates.date2num(date) for date in datafile.get_timestamp()]
+    def save_views(self):
+        for i, subplot in enumerate(self.subplots):
+            if subplot.get_xlim() != self.default_views[i]:
+                self.views[self.first + i] = subplot.get_xlim()
 
-        for i in range(n_sub):
-            norm = bool(i in normalize)
-            draw_set = [datafile.df[header[j]] for j in plot_set[i]]
+    def scroll_to(self, first):
+        plot_set, _ = config.get_plot_info()
+        first = max(0, min(first, len(plot_set) - len(self.subplots)))
+        if first == self.first:
+            return
 
-            subplot = self.figure.add_subplot(grid[i])
-            plotter = Plotter(subplot, draw_set, self.timestamp, norm)
-            self.subplots.append(subplot)
-            self.plotters.append(plotter)
+        self.save_views()
+        self.first = first
+        self.fill()
+        self.canvas.draw()
 
-            subplot.set_xticklabels([]) if i < n_sub-1 else None
-            subplot.legend(loc=1, prop={'size': 8}) if draw_set else None
+    # The view has been resized: subplots are created again if a different number of them fits,
+    #  otherwise the series are sampled again if the plots need a different number of points
+    def update_layout(self):
+        n_slots, first = self.get_layout()
+        if not self.subplots:
+            return False
+        if n_slots == len(self.subplots) and first == self.first:
+            return self.update_resolution()
+
+        self.save_views()
+        self.clear()
+        self.build()
+        return True
+
+    def update_resolution(self):
+        n_max = self.get_n_max()
+        if n_max == self.n_max:
+            return False
+
+        self.n_max = n_max
+        for p in self.plotters:
+            p.n_max = n_max
+        self.resample_plots([p for p in self.plotters if not p.is_empty()])
+        return True
 
+    # Columns of the plots next to the visible ones are read and indexed in advance
+    def prepare_margin(self):
+        datafile = config.get_datafile()
+        plot_set, _ = config.get_plot_info()
+        if not datafile.is_loaded():
+            return
+
+        last = self.first + len(self.subplots)
+        indexes = list(range(max(0, self.first - MARGIN), self.first)) + list(range(last, last + MARGIN))
+        datafile.get_pyramids([j for index in indexes if index < len(plot_set) for j in plot_set[index]], sampler)
+
+    # A block of rows has been read: timestamps, lines and labels are updated
+    def update_rows(self):
+        self.views = {}
+        datafile = config.get_datafile()
+        if self.timestamp is not None:
+            self.timestamp = datafile.get_plot_dates()
+
+        point_sets = self.sample_points([p.pyramids for p in self.plotters], [p.method for p in self.plotters],
+                                        0, datafile.get_shape())
+        for p, point_set in zip(self.plotters, point_sets):
+            p.extend(self.timestamp, point_set)
         self.manage_empty()
         self.insert_labels()
-        self.canvas.refresh()
+        self.canvas.draw_idle()
 
     def add_label(self, new_x):
         x1 = min(self.canvas.prev_x, new_x)
         x2 = max(self.canvas.prev_x, new_x)
 
-        datafile = config.get_datafile()
+        store = config.get_datafile().label_store
         label, color = config.get_current_label()
+        a, b = self.get_rows(x1, x2)
 
-        if not self.timestamp:
-            n_rows = datafile.get_shape()
-            a = max(int(round(x1)), 0)
-            b = max(int(round(x2)), 0)
-            x1 = min(a, n_rows-1)
-            x2 = min(b, n_rows-1)
-            if x1 == x2:
-                x1 = x1 - 0.5
-                x2 = x2 + 0.5
-        else:
-            a = get_nearest_index(x1, self.timestamp)
-            b = get_nearest_index(x2, self.timestamp)
-            x1 = self.timestamp[a]
-            x2 = self.timestamp[b]
-            if x1 == x2:
-                span = (self.timestamp[-1] - self.timestamp[0]) / (10 * len(self.timestamp))
-                x1 = x1 - span
-                x2 = x2 + span
+        # Intervals of the same label which overlap or touch the new one are merged into it
+        merged = store.insert(label, a, b)
+        if merged.shape[0] > 0:
+            for plots in self.plotters:
+                plots.remove_span(merged)
+            self.label_index.remove(merged)
 
+        x1, x2 = self.get_label_limits(store.starts[-1:], store.ends[-1:])
         for plots in self.plotters:
-            plots.add_rect(x1=x1, x2=x2, color=color)
-        datafile.labels_list.append([label, (a, b)])
+            plots.add_span(x1=x1[0], x2=x2[0], color=color)
+            plots.set_preview()
+        self.label_index.add(x1, x2)
 
         self.canvas.modified = True
-        self.canvas.draw()
+        self.canvas.draw_idle()
+
+    def get_rows(self, x1, x2):
+        if self.timestamp is None:
+            n_rows = config.get_datafile().get_shape()
+            a = min(max(int(round(x1)), 0), n_rows-1)
+            b = min(max(int(round(x2)), 0), n_rows-1)
+        else:
+            a = get_nearest_index(x1, self.timestamp)
+            b = get_nearest_index(x2, self.timestamp)
+        return a, b
+
+    # Plot coordinates of the labels (single rows are widened to be visible)
+    def get_label_limits(self, starts, ends):
+        if self.timestamp is None:
+            x1 = starts.astype(float)
+            x2 = ends.astype(float)
+            span = 0.5
+        else:
+            x1 = index_to_date(starts, self.timestamp)
+            x2 = index_to_date(ends, self.timestamp)
+            span = (self.timestamp[-1] - self.timestamp[0]) / (10 * len(self.timestamp))
+
+        single = x1 == x2
+        x1[single] -= span
+        x2[single] += span
+        return x1, x2
 
     def remove_label(self, event):
         clk = self.find_clicked_rect(event)
@@ -105,42 +248,27 @@ class PlotCore:
             return
 
         for plots in self.plotters:
-            plots.remove_rect(clk)
-        del config.get_datafile().labels_list[clk]
+            plots.remove_span(clk)
+        config.get_datafile().label_store.remove(clk)
+        self.label_index.remove(clk)
 
         self.canvas.modified = True
         self.canvas.draw()
 
+    # All the plots share the same labels, so a single index is enough
     def find_clicked_rect(self, event):
-        clicked_rects = None
-        for plots in self.plotters:
-            if event.inaxes == plots.plot:
-                clicked_rects = plots.click_on_rect(event)
-        index = [i for i, x in enumerate(clicked_rects) if x]
-        if len(index) == 0:
+        if event.inaxes not in self.subplots or event.xdata is None:
             return None
-        else:
-            return index[-1]
+        return self.label_index.find(event.xdata)
 
     def insert_labels(self):
-        datafile = config.get_datafile()
-        for lab in datafile.labels_list:
-            if self.timestamp:
-                x1 = self.timestamp[lab[1][0]]
-                x2 = self.timestamp[lab[1][1]]
-                if x1 == x2:
-                    span = (self.timestamp[-1] - self.timestamp[0]) / (10 * len(self.timestamp))
-                    x1 = x1 - span
-                    x2 = x2 + span
-            else:
-                x1 = lab[1][0]
-                x2 = lab[1][1]
-                if x1 == x2:
-                    x1 = x1 - 0.5
-                    x2 = x2 + 0.5
+        store = config.get_datafile().label_store
+        x1, x2 = self.get_label_limits(store.starts, store.ends)
+        colors = [config.get_label_color(store.names[i]) for i in store.ids]
+        self.label_index.set(x1, x2)
 
-            for plot in self.plotters:
-                plot.add_rect(x1=x1, x2=x2, color=config.get_label_color(lab[0]))
+        for plot in self.plotters:
+            plot.set_spans(x1, x2, colors)
 
     def manage_empty(self):
         x_lim = None
@@ -152,21 +280,72 @@ class PlotCore:
             if plot.is_empty() and x_lim:
                 plot.plot.set_xlim(x_lim)
 
+    # Only the overlay is repainted, unless a legend has been moved
     def move_cursor(self, xs):
+        prev_x = self.canvas.prev_x
+        color = config.get_current_label()[1]
+
+        redraw = False
         for p in self.plotters:
-            p.move_line(xs)
-        self.canvas.draw()
+            redraw |= p.move_line(xs)
+            if prev_x is None:
+                p.set_preview()
+            else:
+                p.set_preview(min(prev_x, xs[0]), max(prev_x, xs[0]), color)
 
-    def zoom_in(self):
+        if redraw:
+            self.canvas.draw_idle()
+        else:
+            self.canvas.blit_overlay()
+
+    def draw_overlay(self):
         for p in self.plotters:
-            p.zoom_in()
+            p.draw_overlay()
+
+    # Series of many plots showing the same rows are sampled in a single batch, each column once
+    #  (for each downsampling method)
+    def sample_points(self, pyramid_sets, methods, a, b):
+        jobs = {(id(pyr), method): pyr for pyramid_set, method in zip(pyramid_sets, methods) for pyr in pyramid_set}
+        point_set = sample_range(list(jobs.values()), a, b, [method for _, method in jobs], self.timestamp, self.n_max)
+        points = dict(zip(jobs, point_set))
+        return [[points[id(pyr), method] for pyr in pyramid_set] for pyramid_set, method in zip(pyramid_sets, methods)]
+
+    def update_points(self, plotters, xlim):
+        point_sets = self.sample_points([p.pyramids for p in plotters], [p.method for p in plotters],
+                                        *get_row_range(xlim, self.timestamp))
+        for p, point_set in zip(plotters, point_sets):
+            p.update_lines(p.normalize_points(point_set))
+
+    # Plots with the same view are sampled together
+    def resample_plots(self, plotters):
+        views = {}
+        for p in plotters:
+            views.setdefault(p.plot.get_xlim(), []).append(p)
+        for xlim, same_view in views.items():
+            self.update_points(same_view, xlim)
+
+    def resample(self):
+        self.resample_plots([p for p in self.plotters if p.is_sampled()])
         self.canvas.draw()
 
-    def zoom_out(self):
+    # All the plots are given the same view, zoomed around the cursor
+    def zoom(self, factor):
+        shown = [p for p in self.plotters if not p.is_empty()]
+        if not shown:
+            return
+
+        xlim = shown[0].get_zoom(factor)
+        self.update_points([p for p in shown if p.is_sampled()], xlim)
         for p in self.plotters:
-            p.zoom_out()
+            p.plot.set_xlim(xlim)
         self.canvas.draw()
 
+    def zoom_in(self):
+        self.zoom(2)
+
+    def zoom_out(self):
+        self.zoom(0.5)
+
 
 # Should handle the events and report the actions to the core
 class PlotCanvas(FigureCanvas):
@@ -181,14 +360,23 @@ class PlotCanvas(FigureCanvas):
 
         self.core = PlotCore(self)
         self.toolbar = PlotToolbar(self, window)
+        self.scrollbar = window.scroll_canvas.scrollbar
+        self.scrollbar.valueChanged.connect(self.core.scroll_to)
 
         self.dragging = False
         self.modified = False
         self.prev_x = None
+        self.background = None  # figure without the overlay, used for blitting
 
+        # Reads the blocks of streamed files when there are no events to handle
+        self.loader = QTimer(self)
+        self.loader.timeout.connect(self.load_chunk)
+
+        self.figure.canvas.mpl_connect('draw_event', self.on_draw)
         self.figure.canvas.mpl_connect('button_press_event', self.on_mouse_press)
         self.figure.canvas.mpl_connect('button_release_event', self.on_mouse_release)
         self.figure.canvas.mpl_connect('motion_notify_event', self.on_motion)
+        self.figure.canvas.mpl_connect('scroll_event', self.on_scroll)
 
     def init(self):
         self.toolbar.update_label()
@@ -198,30 +386,35 @@ class PlotCanvas(FigureCanvas):
         self.toolbar.update_label()
         self.draw()
 
+    def load_chunk(self):
+        if config.get_datafile().load_chunk():
+            self.core.update_rows()
+        else:
+            self.loader.stop()
+
     # noinspection PyPep8Naming
-    def minimumSizeHint(self):
-        return self.sizeHint()
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.figure_resize()
 
+    # The figure fills the view, the plots which don't fit are reached with the scrollbar
     def figure_resize(self):
-        plot_set, _ = config.get_plot_info()
-        n_sub = len(plot_set)
-
-        w, h = self.labeler.size().width(), self.labeler.size().height()
-        sw = 20  # scrollbar width (plus margins)
-        mh = config.get_plot_height()  # minimum subplot height
+        if self.core.update_layout():
+            self.draw_idle()
 
-        toolbar_height = self.toolbar.sizeHint().height() / 100
-        menubar_height = self.labeler.menubar.sizeHint().height() / 100
-        eh = toolbar_height + menubar_height + 0.1  # extra height to be considered
+    def set_scroll(self, value, maximum, page):
+        self.scrollbar.blockSignals(True)
+        self.scrollbar.setRange(0, max(0, maximum))
+        self.scrollbar.setPageStep(max(1, page))
+        self.scrollbar.setValue(value)
+        self.scrollbar.blockSignals(False)
+        self.scrollbar.setVisible(maximum > 0)
 
-        width = (w - sw) / 100
-        height = max(n_sub * mh, (h / 100) - eh)
-
-        self.figure.set_size_inches(width, height, forward=True)
-        self.draw()
+    def on_scroll(self, event):
+        self.scrollbar.setValue(self.scrollbar.value() - int(event.step))
 
     def same_index(self, new_x):
-        if not self.core.timestamp:
+        if self.core.timestamp is None:
             datafile = config.get_datafile()
             n_rows = datafile.get_shape()
             x1 = max(int(round(self.prev_x)), 0)
@@ -236,6 +429,10 @@ class PlotCanvas(FigureCanvas):
         return x1 == x2
 
     def on_mouse_press(self, event):
+        # Pan and zoom to rectangle are handled by the toolbar
+        if self.toolbar.mode:
+            return
+
         if event.button not in (MOUSE_LEFT, MOUSE_RIGHT) or event.inaxes not in self.core.subplots:
             self.prev_x = None
             return
@@ -248,13 +445,18 @@ class PlotCanvas(FigureCanvas):
                 self.core.add_label(event.xdata)
                 self.prev_x = None
         elif event.button == MOUSE_RIGHT:
-            index = self.core.subplots.index(event.inaxes)
+            index = self.core.first + self.core.subplots.index(event.inaxes)
             popup = RightClickMenu(self, index, event)
             popup.exec_()
             if popup.reload:
                 self.core.redraw()
 
     def on_mouse_release(self, event):
+        # The visible range may have changed, so the downsampled series are updated
+        if self.toolbar.mode:
+            self.core.resample()
+            return
+
         if event.button not in (MOUSE_LEFT, MOUSE_RIGHT) or event.inaxes not in self.core.subplots:
             self.prev_x = None
             return
@@ -270,6 +472,21 @@ class PlotCanvas(FigureCanvas):
             self.core.add_label(event.xdata)
             self.prev_x = None
 
+    # noinspection PyUnusedLocal
+    def on_draw(self, event):
+        self.background = self.copy_from_bbox(self.figure.bbox)
+        self.core.draw_overlay()
+
+    def blit_overlay(self):
+        if self.background is None:
+            self.draw_idle()
+            return
+
+        self.restore_region(self.background)
+        self.core.draw_overlay()
+        for subplot in self.core.subplots:
+            self.blit(subplot.bbox)
+
     def on_motion(self, event):
         if event.inaxes not in self.core.subplots:
             return
@@ -301,12 +518,20 @@ class PlotCanvas(FigureCanvas):
         self.labeler.update_dimensions()
         self.labeler.update_functions()
 
+    # Changes saved as a delta are written into the file too
     def save(self):
-        if self.modified:
+        if self.modified or config.get_datafile().has_delta():
             config.save_file()
         config.save_data_config()
         self.modified = False
 
+    # Only the changes are saved, the files are written when closing the application
+    def autosave(self):
+        if self.modified:
+            config.save_file(compact=False)
+        config.save_data_config()
+        self.modified = False
+
     def next_label(self):
         config.next_label()
         self.toolbar.update_label()
@@ -318,7 +543,7 @@ class PlotCanvas(FigureCanvas):
     def next_file(self):
         if self.modified or config.is_modified():
             if config.get_autosave():
-                self.save()
+                self.autosave()
             else:
                 answer = dialogs.ask_to_continue()
                 if not answer:
@@ -329,7 +554,7 @@ class PlotCanvas(FigureCanvas):
     def prev_file(self):
         if self.modified or config.is_modified():
             if config.get_autosave():
-                self.save()
+                self.autosave()
             else:
                 answer = dialogs.ask_to_continue()
                 if not answer:
@@ -338,14 +563,22 @@ class PlotCanvas(FigureCanvas):
         self.reset()
 
     def quit(self):
+        if self.close_session():
+            config.end_session()
+            exit(0)
+
+    # Changes are saved (or discarded) and the ones saved as a delta are written into the files.
+    # Returns False if the user doesn't want to leave.
+    def close_session(self):
         if self.modified or config.is_modified():
             if config.get_autosave():
-                self.save()
+                self.autosave()
             else:
                 answer = dialogs.ask_to_continue()
                 if not answer:
-                    return
-        exit(0)
+                    return False
+        config.compact_files()
+        return True
 
 
 # noinspection PyArgumentList
@@ -1,127 +1,435 @@
 import os
+import numpy as np
 import pandas as pd
+import matplotlib.dates as mdates
 from formats.format import *
+from pyramid import Pyramid
+from labels import LabelStore
+import cache
+import delta
 import config
+from saver import replace_file
 
 TIMESTAMP = 'Timestamp'
+CHUNK_ROWS = 1 << 20  # rows read at once from files which are streamed
+SAMPLE_ROWS = 1000  # rows measured to estimate the memory used by text columns
 
 
 class DataFile:
-    def __init__(self, filename, labels):
+    # select_columns(header) gives the names of the columns to read when the file is opened
+    #  (None for all of them), the others are read when they are first used
+    def __init__(self, filename, labels, select_columns=None):
         self.filename = filename
 
         self.df = None
-        self.labels_list = []
+        self.label_store = LabelStore()
+        self.pyramids = {}  # downsampling indexes, built on first use
+        self.timestamps = None  # parsed timestamps of the rows read so far (datetime64)
+        self.plot_dates = None  # the same as matplotlib dates
 
-        ext = os.path.splitext(filename)[1]
-        self.io = get_format(ext)
+        # Columns (labels excluded) are indexed by their position in the header, the DataFrame
+        #  holds only the ones which have been read
+        self.header = []
+        self.loaded = []  # columns in df, in the same order
+        self.file_header = []  # columns of the file
+        self.sources = []  # position of each column in file_header (None for functions)
+        self.select_columns = select_columns
+
+        # Big files are read in blocks: until the last one, df holds only the first block
+        self.reader = None
+        self.chunks = None
+        self.labels = labels
+
+        # With the column store, blocks are written to disk as they are read and columns are memory mapped
+        self.writer = None
+        self.mapped = False
+        self.derived_files = {}  # function name -> its file in the column store
+        self.time_formats = {}  # column name -> format of the stored (parsed) timestamps
+
+        # Changes can be saved apart from the file (see delta.py)
+        self.file_columns = []
+        self.delta_files = {}  # function name -> (file, values) of the ones already in the delta
+
+        self.io = get_format(filename)
 
         if self.io is None:
             config.logger.error("Unrecognized format for file: {}".format(self.filename))
             raise UnrecognizedFormatError
 
-        self.read()
-        self.update_labels_list(labels)
+        self.read(labels)
+
+    # The column store keeps labels as intervals, so they are parsed only from the original file.
+    # It's built from all the columns, which are then memory mapped: they are never selected.
+    def read(self, labels):
+        use_cache = config.get_binary_cache()
+        cached = cache.load(self.filename, labels) if use_cache else None
+        self.pyramids = {}
+        self.timestamps = None
+        self.plot_dates = None
+        self.time_formats = {}
+
+        if cached is not None:
+            self.df, self.label_store, self.time_formats = cached
+            self.mapped = True
+            self.set_header(list(self.df))
+            self.apply_delta()
+            return
+
+        names = None if use_cache or self.select_columns is None else self.get_selected(labels)
+        if os.path.getsize(self.filename) > config.get_stream_threshold():
+            self.reader = self.io.read_chunks(self.filename, CHUNK_ROWS, names)
+            self.df = next(self.reader, None)
+        else:
+            self.df = self.io.read(self.filename, names)
 
-    def read(self):
-        self.df = self.io.read(self.filename)
         if self.df is None:
             config.logger.error("Cannot read file {}, is it structured correctly?".format(self.filename))
             raise BadFileError
 
+        self.update_label_store(labels)
+        if names is None:
+            self.set_header(list(self.df))
+        self.chunks = []
+        self.writer = self.open_writer(labels) if use_cache else None
+        self.add_chunk(self.df)
+        self.df = self.chunks[0]
+
+        # Changes saved apart need the whole file
+        if self.reader is None or delta.exists(self.filename):
+            self.load()
+
+    def open_writer(self, labels):
+        try:
+            return cache.Writer(self.filename, labels, self.label_store)
+        except OSError as e:
+            config.logger.error("Cannot build the column store of {}: {}".format(self.filename, e))
+            return None
+
+    # Names of the columns to read, always including timestamps and labels
+    def get_selected(self, labels):
+        file_header = self.io.read_header(self.filename)
+        if file_header is None:
+            return None
+
+        header = [name for name in file_header if name not in labels]
+        names = self.select_columns(header)
+        if names is None:
+            return None
+
+        names = set(names) | {TIMESTAMP}
+        if not any(name in names for name in header) and header:
+            names.add(header[0])  # rows can't be counted without columns
+        self.set_header(header, [j for j, name in enumerate(header) if name in names])
+        return names | set(labels)
+
+    def set_header(self, header, loaded=None):
+        self.header = list(header)
+        self.file_header = list(header)
+        self.sources = list(range(len(header)))
+        self.loaded = list(range(len(header))) if loaded is None else loaded
+
+    def has_delta(self):
+        return delta.exists(self.filename)
+
+    def is_loaded(self):
+        return self.reader is None
+
+    # Reads the next block of a streamed file: returns False once the whole file has been read
+    def load_chunk(self):
+        if self.reader is None:
+            return False
+
+        try:
+            chunk = next(self.reader)
+        except StopIteration:
+            self.finish_reading()
+            return False
+
+        if chunk is None:
+            config.logger.error("Cannot read file {} entirely, is it structured correctly?".format(self.filename))
+            self.finish_reading()
+            return False
+
+        offset = self.get_shape()
+        self.label_store.extend_columns(chunk, self.labels, offset)
+        if self.writer is not None:
+            self.writer.label_store.extend_columns(chunk, self.labels, offset)
+        for label in self.labels:
+            if label in list(chunk):
+                del chunk[label]
+
+        self.add_chunk(chunk)
+        for column, pyr in self.pyramids.items():
+            pyr.extend(self.chunks[-1].iloc[:, self.loaded.index(column)].values)
+        return True
+
+    def add_chunk(self, chunk):
+        if self.writer is not None:
+            mapped = self.writer.append(chunk)
+            if mapped is None:  # it can't be stored, data are kept in memory
+                self.writer.discard()
+                self.writer = None
+            else:
+                chunk = mapped
+        self.chunks.append(chunk)
+
+    def load(self):
+        if self.reader is None and self.chunks is not None:
+            self.finish_reading()
+        while self.load_chunk():
+            pass
+
+    def finish_reading(self):
+        stored = self.writer.finish() if self.writer is not None else None
+        if stored is not None:
+            df, self.time_formats = stored
+            df.columns = self.df.columns
+            self.df = df
+            self.mapped = True
+        else:
+            self.df = pd.concat(self.chunks) if len(self.chunks) > 1 else self.chunks[0]
+
+        self.reader = None
+        self.chunks = None
+        self.writer = None
+        for column, pyr in self.pyramids.items():
+            pyr.set_values(self.df.iloc[:, self.loaded.index(column)].values)
+        self.apply_delta()
+
+    # Columns which have not been read yet are read from the file (entirely loaded first)
+    def load_columns(self, columns):
+        missing = [j for j in columns if j not in self.loaded]
+        if not missing:
+            return
+
+        self.load()
+        names = [self.header[j] for j in missing]
+        df = self.io.read(self.filename, names)
+        read = [p for p, name in enumerate(self.file_header) if name in names]  # columns of df
+        if df is None or df.shape[0] != self.get_shape():
+            config.logger.error("Cannot read the columns {} of {}".format(names, self.filename))
+
+        for j in missing:
+            if df is None or df.shape[0] != self.get_shape():
+                values = np.full(self.get_shape(), np.nan)
+            else:
+                values = df.iloc[:, read.index(self.sources[j])].values
+            i = sum(k < j for k in self.loaded)
+            self.df.insert(i, self.header[j], pd.Series(values, index=self.df.index, copy=False), allow_duplicates=True)
+            self.loaded.insert(i, j)
+
+    def insert_column(self, name, series):
+        self.df.insert(self.df.shape[1], name, series, allow_duplicates=True)
+        self.header.append(name)
+        self.sources.append(None)
+        self.loaded.append(len(self.header) - 1)
+
+    def apply_delta(self):
+        self.file_columns = list(self.header)
+        saved = delta.load(self.filename, self.labels)
+        if saved is None:
+            return
+
+        self.label_store, columns, removed = saved
+        for name in removed:
+            self.remove_function(name)
+        for name, file, values in columns:
+            self.insert_column(name, pd.Series(values, name=name, copy=False))
+            self.delta_files[name] = (file, values)
+
+    def get_column(self, column):
+        self.load_columns([column])
+        i = self.loaded.index(column)
+        if self.chunks is None:
+            return self.df.iloc[:, i].values
+        return np.concatenate([chunk.iloc[:, i].values for chunk in self.chunks])
+
+    # Values as they are written to the file: timestamps parsed by the column store go back to text
+    def get_text_column(self, column):
+        values = self.get_column(column)
+        if self.header[column] in self.time_formats and values.dtype.kind == 'M':
+            return cache.TextColumn(values, self.time_formats[self.header[column]])
+        return values
+
+    # Rows read so far (only the first block, while a big file is being read)
+    def get_series(self, column):
+        self.load_columns([column])
+        return self.df.iloc[:, self.loaded.index(column)]
+
+    # Missing pyramids are built together on the worker pool: columns are read (in a single
+    #  read) on the calling thread, only the indexing runs on the workers
+    def get_pyramids(self, columns, pool):
+        missing = list(dict.fromkeys(j for j in columns if j not in self.pyramids))
+        if missing:
+            self.load_columns(missing)
+            values = [self.get_column(j) for j in missing]
+            self.pyramids.update(zip(missing, pool.map(Pyramid, values)))
+        return [self.pyramids[j] for j in columns]
+
     def get_shape(self):
-        return self.df.shape[0]
+        if self.chunks is None:
+            return self.df.shape[0]
+        return sum(chunk.shape[0] for chunk in self.chunks)
+
+    def get_memory_usage(self):
+        chunks = [self.df] if self.chunks is None else self.chunks
+        return int(sum(get_frame_memory(chunk) for chunk in chunks))
 
     def get_data_columns(self):
         data_col = []
-        for i, key in enumerate(self.df):
+        for i, key in enumerate(self.header):
             if key != TIMESTAMP:
                 data_col.append(i)
         return data_col
 
-    def get_original_columns(self):
-        functions = config.get_functions()
+    def get_original_columns(self, functions=None):
+        functions = config.get_functions() if functions is None else functions
 
         orig_col = []
-        for i, key in enumerate(self.df):
+        for i, key in enumerate(self.header):
             if key not in functions:
                 orig_col.append(i)
         return orig_col
 
-    def get_function_columns(self):
-        functions = config.get_functions()
+    def get_function_columns(self, functions=None):
+        functions = config.get_functions() if functions is None else functions
 
         func_col = []
-        for i, key in enumerate(self.df):
+        for i, key in enumerate(self.header):
             if key in functions:
                 func_col.append(i)
         return func_col
 
     def get_data_header(self):
         col_names = []
-        for key in list(self.df):
+        for key in self.header:
             if key != TIMESTAMP:
                 col_names.append(key)
         return col_names
 
+    # Timestamps of the rows loaded so far (they are always read). They are parsed only once:
+    #  while a big file is read, only the rows of the new blocks are parsed.
     def get_timestamp(self):
         if TIMESTAMP not in list(self.df):
-            return []
-        return pd.to_datetime(self.df[TIMESTAMP])
+            return None
+
+        start = 0 if self.timestamps is None else self.timestamps.shape[0]
+        if start < self.get_shape():
+            if self.chunks is None:
+                values = self.df[TIMESTAMP].iloc[start:]
+            else:
+                values = pd.concat([chunk[TIMESTAMP] for chunk in self.chunks if chunk.index[-1] >= start]).loc[start:]
+            parsed = pd.to_datetime(values).to_numpy()
+            self.timestamps = parsed if self.timestamps is None else np.concatenate((self.timestamps, parsed))
+        return self.timestamps
 
-    @staticmethod
-    def get_label_range(label_col):
-        indexes = [i for i, val in enumerate(label_col) if val == 1.0]
-        return indexes[0], indexes[-1]
+    # Timestamps as matplotlib dates (days as floats), or None if there are none
+    def get_plot_dates(self):
+        timestamps = self.get_timestamp()
+        if timestamps is None or timestamps.shape[0] == 0:
+            return None
+
+        start = 0 if self.plot_dates is None else self.plot_dates.shape[0]
+        if start < timestamps.shape[0]:
+            dates = np.asarray(mdates.date2num(timestamps[start:]), dtype=float)
+            self.plot_dates = dates if self.plot_dates is None else np.concatenate((self.plot_dates, dates))
+        return self.plot_dates
 
-    def update_labels_list(self, labels):
-        self.labels_list = []
-        for i, key in enumerate(list(self.df)):
-            if key in labels:
-                data = self.df.iloc[:, i]
-                self.labels_list.append([key, self.get_label_range(data)])
+    def update_label_store(self, labels):
+        self.label_store = LabelStore.from_columns(self.df, labels)
 
         # Labels are removed from DataFrame to avoid mistakes
         for label in labels:
             if label in list(self.df):
                 del self.df[label]
 
-    def get_label_series(self, label):
-        a = label[1][0]
-        b = label[1][1] + 1
-        n_rows = self.get_shape()
-        s = pd.Series(n_rows * [''], name=label[0])
-        for i in range(a, b):
-            s.iat[i] = '1'
-        return s
-
-    def labels_list_to_df(self):
-        if not self.labels_list:
-            return None
+    # Function names are taken from the current configuration, unless specified.
+    # Columns are handed to the format as they are, which writes them block by block
+    #  on the saver thread (labels are copied, since they can be edited meanwhile).
+    def save(self, functions=None):
+        self.load()
+        self.load_columns(range(len(self.header)))
+        columns = []
+        for i in self.get_original_columns(functions) + self.get_function_columns(functions):
+            columns.append((self.header[i], self.get_text_column(i)))
+        file_columns = [name for name, _ in columns]
+        columns += self.label_store.copy().get_columns(self.get_shape())
 
-        columns = [self.get_label_series(l) for l in self.labels_list]
-        all_columns = pd.concat(columns, axis=1)
-        return all_columns
+        self.file_columns = file_columns
+        config.queue_save(self.filename, "file", lambda: self.write(columns))
 
-    def save(self):
-        label_df = self.labels_list_to_df()
-        func_df = self.df.iloc[:, self.get_function_columns()]
-        all_data = self.df.iloc[:, self.get_original_columns()]
+    def write(self, columns):
+        replace_file(self.filename, lambda tmp: self.io.save_columns(columns, tmp))
+        delta.discard(self.filename)
+        self.delta_files = {}
 
-        if func_df is not None:
-            all_data = pd.concat([all_data, func_df], axis=1)
-        if label_df is not None:
-            all_data = pd.concat([all_data, label_df], axis=1)
+    # Labels and functions are saved apart, without writing the file (which is done by save)
+    def save_delta(self, functions=None):
+        self.load()
+        functions = config.get_functions() if functions is None else functions
 
-        self.io.save(all_data, self.filename)
+        columns = []
+        for i in self.get_function_columns(functions):
+            if self.header[i] not in self.file_columns:
+                columns.append((self.header[i], self.get_column(i)))
+        removed = [name for name in self.file_columns if name not in self.header]
+
+        label_store = self.label_store.copy()
+        config.queue_save(self.filename, "delta", lambda: self.write_delta(label_store, columns, removed))
+
+    def write_delta(self, label_store, columns, removed):
+        stored = delta.store(self.filename, label_store, columns, removed, self.delta_files)
+        if stored is None:
+            raise IOError("the delta can't be written")
+        self.delta_files = stored
 
     def get_series_to_process(self, column, name):
-        data = self.df.iloc[:, column]
-        index = pd.DatetimeIndex(self.df[TIMESTAMP]) if TIMESTAMP in self.df else self.df.index
+        self.load()
+        data = self.get_series(column)
+        index = pd.DatetimeIndex(self.get_timestamp()) if TIMESTAMP in self.df else self.df.index
         return pd.Series(data.values, index=index, name=name)
 
+    # Columns are added without copying the others (the memory mapped ones would be read entirely)
     def add_function(self, series):
-        self.df = pd.concat([self.df, series], axis=1)
+        self.load()
+        stored = cache.store_column(self.filename, series.values) if self.mapped else None
+        if stored is not None:
+            self.derived_files[series.name], values = stored
+            series = pd.Series(values, index=series.index, name=series.name, copy=False)
+        self.insert_column(series.name, series)
 
     def remove_function(self, f_name):
-        del self.df[f_name]
+        self.load()
+        removed = [i for i, key in enumerate(self.header) if key == f_name]
+        if f_name in self.df:
+            del self.df[f_name]
+        if f_name in self.derived_files:
+            cache.remove_column(self.filename, self.derived_files.pop(f_name))
+
+        # Pyramids of the other columns are kept, following the shift of their indexes
+        def shift(column):
+            return column - sum(i < column for i in removed)
+
+        self.header = [key for key in self.header if key != f_name]
+        self.sources = [p for i, p in enumerate(self.sources) if i not in removed]
+        self.loaded = [shift(column) for column in self.loaded if column not in removed]
+        pyramids = {}
+        for column, pyr in self.pyramids.items():
+            if column not in removed:
+                pyramids[shift(column)] = pyr
+        self.pyramids = pyramids
+
+
+# Strings (e.g. timestamps) are counted with their contents, measured on a sample of the rows
+#  of big columns, since measuring all of them takes as long as reading the file
+def get_frame_memory(df):
+    n_rows = df.shape[0]
+    total = df.index.memory_usage(deep=True)
+    for i in range(df.shape[1]):
+        column = df.iloc[:, i]
+        if column.dtype.kind == 'O' and n_rows > SAMPLE_ROWS:
+            sample = column.iloc[np.linspace(0, n_rows - 1, SAMPLE_ROWS).astype(int)]
+            total += sample.memory_usage(index=False, deep=True) * n_rows / SAMPLE_ROWS
+        else:
+            total += column.memory_usage(index=False, deep=True)
+    return total
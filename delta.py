@@ -0,0 +1,96 @@
+import os
+import json
+import shutil
+import numpy as np
+from labels import LabelStore
+from saver import replace_file
+import cache
+
+VERSION = 2
+META = "meta.json"
+LABELS = "labels.npy"
+
+
+# Changes of a data file which have not been written into it yet: its labels (as intervals) and
+#  the functions added or removed since it was saved. They are kept in a folder next to the file,
+#  with each added function in its own .npy file written only once, so saving them is cheap.
+#  The file itself is rewritten (and the delta removed) only when it's compacted.
+def get_path(filename):
+    return filename + ".delta"
+
+
+def get_stamp(filename):
+    try:
+        return os.stat(os.path.join(get_path(filename), META)).st_mtime_ns
+    except OSError:
+        return None
+
+
+def exists(filename):
+    return get_stamp(filename) is not None
+
+
+# Returns the labels, the added columns as (name, file, values) and the names of the removed ones.
+# Intervals of labels which are no longer configured (renamed or removed meanwhile) are dropped.
+def load(filename, labels):
+    folder = get_path(filename)
+    try:
+        with open(os.path.join(folder, META)) as in_file:
+            meta = json.load(in_file)
+        if meta["version"] != VERSION or meta["source"] != cache.get_stamp(filename):
+            discard(filename)  # the file has been changed by someone else
+            return None
+
+        label_store = LabelStore.from_array(meta["names"], np.load(os.path.join(folder, LABELS))).select(labels)
+        columns = []
+        for name, file in meta["added"]:
+            columns.append((name, file, np.load(os.path.join(folder, file), mmap_mode='r')))
+    except (IOError, ValueError, KeyError):
+        return None
+    return label_store, columns, meta["removed"]
+
+
+# Columns already written (name -> (file, values)) are not written again.
+# Returns the written columns, or None if the delta can't be saved.
+def store(filename, label_store, columns, removed, written):
+    folder = get_path(filename)
+    stored = {}
+    try:
+        os.makedirs(folder, exist_ok=True)
+        for name, values in columns:
+            if name in written and np.may_share_memory(values, written[name][1]) and \
+                    os.path.exists(os.path.join(folder, written[name][0])):
+                stored[name] = written[name]
+                continue
+
+            k = 0
+            while os.path.exists(os.path.join(folder, "{}.npy".format(k))):
+                k += 1
+            file = "{}.npy".format(k)
+            np.save(os.path.join(folder, file), np.asarray(values))
+            stored[name] = (file, values)
+
+        replace_file(os.path.join(folder, LABELS), lambda tmp: np.save(tmp, label_store.to_array()))
+        meta = {
+            "version": VERSION,
+            "source": cache.get_stamp(filename),
+            "names": label_store.names,
+            "added": [[name, stored[name][0]] for name, _ in columns],
+            "removed": removed
+        }
+        with open(os.path.join(folder, META + ".tmp"), 'w') as out_file:
+            json.dump(meta, out_file)
+        os.replace(os.path.join(folder, META + ".tmp"), os.path.join(folder, META))
+    except IOError:
+        return None
+
+    # Functions which have been removed meanwhile
+    used = [file for file, _ in stored.values()] + [META, LABELS]
+    for file in os.listdir(folder):
+        if file not in used:
+            os.remove(os.path.join(folder, file))
+    return stored
+
+
+def discard(filename):
+    shutil.rmtree(get_path(filename), ignore_errors=True)
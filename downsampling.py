@@ -0,0 +1,121 @@
+import numpy as np
+
+LTTB = "lttb"
+M4 = "m4"
+BLOCK = 1 << 22  # triangle areas computed at once (bounds temporary memory)
+TABLE_WIDTH = 16  # widest buckets whose areas are computed for all the possible previous points
+
+
+# Downsampling algorithms: given the coordinates of the points (x sorted, no NaNs), they return
+#  the positions of the n_out (at most) points to keep, in order.
+#
+# Largest-Triangle-Three-Buckets (Steinarsson, 2013): the inner points are split into n_out - 2
+#  buckets and each bucket keeps the point forming the largest triangle with the point kept in
+#  the previous bucket and the centroid of the next one.
+def lttb(x, y, n_out):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = x.shape[0]
+    if n <= max(n_out, 2):
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])
+
+    # Buckets of the inner points, split as numpy.array_split does
+    n_bins = n_out - 2
+    size, extra = divmod(n - 2, n_bins)
+    sizes = np.full(n_bins, size)
+    sizes[:extra] += 1
+    starts = 1 + np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    width = size + (extra > 0)
+
+    # Centroids of the next buckets (the last point for the last one)
+    cx = np.add.reduceat(x[1:n - 1], starts - 1) / sizes
+    cy = np.add.reduceat(y[1:n - 1], starts - 1) / sizes
+    cx = np.append(cx[1:], x[n - 1])
+    cy = np.append(cy[1:], y[n - 1])
+
+    if width <= TABLE_WIDTH:
+        kept = lttb_table(x, y, starts, sizes, width, cx, cy)
+    else:
+        kept = lttb_buckets(x, y, starts, sizes, cx, cy)
+    return np.concatenate(([0], kept, [n - 1]))
+
+
+# Narrow buckets: the choice depends on the previous one, so the best point is computed for every
+#  point the previous bucket could have kept (width^2 areas for each bucket). Areas of all the
+#  buckets are computed at once, then the kept points are just looked up in order.
+def lttb_table(x, y, starts, sizes, width, cx, cy):
+    n_bins = starts.shape[0]
+
+    # Points of each bucket and of the previous one (the first point before the first bucket)
+    offsets = np.arange(width)
+    members = starts[:, None] + offsets
+    valid = offsets < sizes[:, None]
+    members = np.where(valid, members, starts[:, None])
+    anchors = np.vstack((np.zeros((1, width), dtype=members.dtype), members[:-1]))
+
+    best = np.empty((n_bins, width), dtype=int)
+    step = max(1, BLOCK // (width * width))
+    for i in range(0, n_bins, step):
+        j = min(i + step, n_bins)
+        ax, ay = x[anchors[i:j]][:, :, None], y[anchors[i:j]][:, :, None]
+        bx, by = x[members[i:j]][:, None, :], y[members[i:j]][:, None, :]
+        c_x, c_y = cx[i:j, None, None], cy[i:j, None, None]
+        areas = 0.5 * np.abs((ax - c_x) * (by - ay) - (ax - bx) * (c_y - ay))
+        areas[~np.broadcast_to(valid[i:j, None, :], areas.shape)] = -np.inf
+        best[i:j] = np.argmax(areas, axis=2)
+
+    # Each bucket keeps the best point given the one kept by the previous bucket
+    kept = np.empty(n_bins, dtype=int)
+    k = 0
+    for i, row in enumerate(best.tolist()):
+        k = row[k]
+        kept[i] = k
+    return starts + kept
+
+
+# Wide buckets: one bucket after the other, given the point kept by the previous one (O(n))
+def lttb_buckets(x, y, starts, sizes, cx, cy):
+    kept = np.empty(starts.shape[0], dtype=int)
+    k = 0
+    for i, (start, size, c_x, c_y) in enumerate(zip(starts.tolist(), sizes.tolist(), cx.tolist(), cy.tolist())):
+        ax, ay = x[k], y[k]
+        bx, by = x[start:start + size], y[start:start + size]
+        k = start + int(np.argmax(np.abs((ax - c_x) * (by - ay) - (ax - bx) * (c_y - ay))))
+        kept[i] = k
+    return kept
+
+
+# M4 (Jugel et al., 2014): the x range is split into n_out / 4 columns of the same width (pixels,
+#  when n_out is four times the width of the plot) and each column keeps its first, last, minimum
+#  and maximum points, which are enough to draw the same lines.
+def m4(x, y, n_out):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = x.shape[0]
+    if n <= n_out:
+        return np.arange(n)
+
+    n_columns = max(1, n_out // 4)
+    span = x[-1] - x[0]
+    if span > 0:
+        columns = np.minimum(((x - x[0]) * (n_columns / span)).astype(int), n_columns - 1)
+    else:
+        columns = np.zeros(n, dtype=int)
+
+    starts = np.flatnonzero(np.diff(columns, prepend=-1))
+    ends = np.append(starts[1:], n) - 1
+    counts = ends - starts + 1
+    index = np.repeat(np.arange(starts.shape[0]), counts)
+    lo = np.repeat(np.minimum.reduceat(y, starts), counts)
+    hi = np.repeat(np.maximum.reduceat(y, starts), counts)
+
+    # First position of the minimum and of the maximum of each column
+    first_lo = np.unique(index[y == lo], return_index=True)[1]
+    first_hi = np.unique(index[y == hi], return_index=True)[1]
+    return np.unique(np.concatenate((starts, ends, np.flatnonzero(y == lo)[first_lo],
+                                     np.flatnonzero(y == hi)[first_hi])))
+
+
+METHODS = {LTTB: lttb, M4: m4}
@@ -0,0 +1,129 @@
+from abc import abstractmethod
+import pandas as pd
+from formats.format import Format
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency, the formats are not available
+    pa = feather = pq = None
+
+BLOCK_ROWS = 1 << 20  # rows written at once (a row group of Parquet files)
+
+
+# Columnar formats read through Apache Arrow: only the requested columns are read from disk
+class ArrowFormat(Format):
+    extensions = []
+    requires = ['pyarrow']
+
+    @abstractmethod
+    def get_schema(self, filename):
+        pass
+
+    @abstractmethod
+    def read_table(self, filename, names):
+        pass
+
+    @abstractmethod
+    def open_writer(self, filename, schema):
+        pass
+
+    # The index saved by pandas is not one of the columns
+    def read_header(self, filename):
+        try:
+            return [name for name in self.get_schema(filename).names if not name.startswith("__index_level_")]
+        except (pa.ArrowException, OSError):
+            return None
+
+    def get_names(self, filename, columns):
+        header = self.read_header(filename)
+        if header is None:
+            return None
+        return header if columns is None else [name for name in header if name in columns]
+
+    def read(self, filename, columns=None):
+        try:
+            names = self.get_names(filename, columns)
+            return None if names is None else self.read_table(filename, names).to_pandas()
+        except (pa.ArrowException, OSError):
+            return None
+
+    def save(self, dataframe, filename):
+        self.save_columns([(name, dataframe.iloc[:, i].values) for i, name in enumerate(dataframe)], filename)
+
+    # Blocks are converted to the types of the first one
+    def save_columns(self, columns, filename):
+        names = [name for name, _ in columns]
+        n_rows = len(columns[0][1]) if columns else 0
+        writer = schema = None
+        try:
+            for start in range(0, max(n_rows, 1), BLOCK_ROWS):
+                stop = start + BLOCK_ROWS
+                arrays = []
+                for i, (_, values) in enumerate(columns):
+                    arrays.append(to_arrow(values[start:stop], None if schema is None else schema.field(i).type))
+                batch = pa.RecordBatch.from_arrays(arrays, names=names)
+                if writer is None:
+                    schema = batch.schema
+                    writer = self.open_writer(filename, schema)
+                writer.write_batch(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+# Pandas extension arrays (e.g. strings) may already be made of Arrow chunks
+def to_arrow(values, arrow_type=None):
+    if hasattr(values, "__arrow_array__"):
+        array = values.__arrow_array__(arrow_type)
+        return array.combine_chunks() if isinstance(array, pa.ChunkedArray) else array
+    return pa.array(values, type=arrow_type, from_pandas=True)
+
+
+class ParquetFormat(ArrowFormat):
+    extensions = ['.parquet']
+
+    def get_schema(self, filename):
+        return pq.read_schema(filename)
+
+    def read_table(self, filename, names):
+        return pq.read_table(filename, columns=names, use_pandas_metadata=False)
+
+    # Row groups are read one at a time
+    def read_chunks(self, filename, chunk_rows, columns=None):
+        try:
+            names = self.get_names(filename, columns)
+            if names is None:
+                yield None
+                return
+
+            offset = 0
+            for batch in pq.ParquetFile(filename).iter_batches(batch_size=chunk_rows, columns=names):
+                df = batch.to_pandas()
+                df.index = pd.RangeIndex(offset, offset + df.shape[0])
+                offset += df.shape[0]
+                yield df
+        except (pa.ArrowException, OSError):
+            yield None
+
+    def open_writer(self, filename, schema):
+        return pq.ParquetWriter(filename, schema)
+
+
+# Arrow IPC files (Feather version 2) are read as a whole table: only the selected columns are
+#  read (and decompressed, for compressed files), so there is no need to stream them
+class FeatherFormat(ArrowFormat):
+    extensions = ['.feather', '.arrow']
+
+    def get_schema(self, filename):
+        with pa.memory_map(filename) as source:
+            return pa.ipc.open_file(source).schema
+
+    def read_table(self, filename, names):
+        schema = self.get_schema(filename)
+        return feather.read_table(filename, columns=[i for i, name in enumerate(schema.names) if name in names],
+                                  memory_map=True)
+
+    def open_writer(self, filename, schema):
+        return pa.ipc.new_file(filename, schema)
@@ -1,31 +1,89 @@
+import io
 import csv
+import gzip
 import pandas as pd
 from formats.format import Format
+from formats.csv_writer import open_output, write_csv
+
+BLOCK_ROWS = 1 << 16  # rows written at once
 
 
 class CSVFormat(Format):
     extensions = ['.csv']
+    compression = None
+
+    def open_text(self, filename):
+        if self.compression == 'gzip':
+            return gzip.open(filename, 'rt')
+        if self.compression == 'zstd':
+            import zstandard
+            return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb')))
+        return open(filename)
 
-    @staticmethod
-    def get_dialect(filename):
-        with open(filename) as csv_file:
+    def get_dialect(self, filename):
+        with self.open_text(filename) as csv_file:
             dialect = csv.Sniffer().sniff(csv_file.read(1024))
         return dialect
 
-    def read(self, filename):
+    def get_header(self, filename, dialect):
+        with self.open_text(filename) as f:
+            reader = csv.reader(f, dialect=dialect)
+            header = next(reader)
+        return header
+
+    def read_header(self, filename):
         try:
-            d = self.get_dialect(filename)
-            df = pd.read_csv(filename, dialect=d, sep=d.delimiter, doublequote=d.doublequote)
+            return self.get_header(filename, self.get_dialect(filename))
+        except (csv.Error, StopIteration):
+            return None
+
+    # Columns to read are selected by position, since names can be repeated
+    def get_options(self, filename, columns):
+        d = self.get_dialect(filename)
+        header = self.get_header(filename, d)
+        options = {"dialect": d, "sep": d.delimiter, "doublequote": d.doublequote, "compression": self.compression}
+        if columns is not None:
+            used = [i for i, name in enumerate(header) if name in columns]
+            options["usecols"] = used
+            header = [header[i] for i in used]
+        return options, header
+
+    def read(self, filename, columns=None):
+        try:
+            options, header = self.get_options(filename, columns)
+            df = pd.read_csv(filename, **options)
 
             # Fix for columns with the same name
-            with open(filename, 'r') as f:
-                reader = csv.reader(f, dialect=d)
-                header = next(reader)
             df.columns = header
         except pd.errors.ParserError:
             df = None
 
         return df
 
+    def read_chunks(self, filename, chunk_rows, columns=None):
+        try:
+            options, header = self.get_options(filename, columns)
+            with pd.read_csv(filename, chunksize=chunk_rows, **options) as reader:
+                for df in reader:
+                    df.columns = header
+                    yield df
+        except pd.errors.ParserError:
+            yield None
+
     def save(self, dataframe, filename):
-        dataframe.to_csv(filename, sep=',', index=False)
+        dataframe.to_csv(filename, sep=',', index=False, compression=self.compression)
+
+    def save_columns(self, columns, filename):
+        with open_output(filename, self.compression) as out_file:
+            write_csv(columns, out_file, BLOCK_ROWS)
+
+
+class GzipCSVFormat(CSVFormat):
+    extensions = ['.csv.gz']
+    compression = 'gzip'
+
+
+class ZstdCSVFormat(CSVFormat):
+    extensions = ['.csv.zst']
+    compression = 'zstd'
+    requires = ['zstandard']
@@ -0,0 +1,93 @@
+import io
+import os
+import gzip
+import numpy as np
+import pandas as pd
+
+SEP = ','
+QUOTE = '"'
+GZIP_LEVEL = 1  # compresses almost as well as the default level, several times faster
+ZSTD_LEVEL = 3
+
+
+# Fast CSV output: each block of rows is converted to strings one column at a time with
+#  vectorized numpy operations, producing the same text as DataFrame.to_csv (shortest
+#  representation of floats, empty missing values, minimal quoting).
+def open_output(filename, compression=None):
+    if compression == 'gzip':
+        return gzip.open(filename, 'wt', encoding='utf-8', newline='', compresslevel=GZIP_LEVEL)
+    if compression == 'zstd':
+        import zstandard  # optional dependency
+        raw = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(filename, 'wb'))
+        return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    return open(filename, 'w', encoding='utf-8', newline='')
+
+
+# Columns which can't be formatted here (e.g. dates) are written by pandas
+def can_format(values):
+    kind = getattr(values, 'dtype', np.dtype(object)).kind
+    return kind in 'biufUO'
+
+
+# Strings are checked for characters requiring quotes looking at their code points directly
+def quote(strings):
+    width = strings.dtype.itemsize // 4
+    if strings.shape[0] == 0 or width == 0:
+        return strings
+
+    codes = np.ascontiguousarray(strings).view(np.uint32).reshape(strings.shape[0], width)
+    special = np.isin(codes, [ord(c) for c in (SEP, QUOTE, '\n', '\r')]).any(axis=1)
+    if not special.any():
+        return strings
+
+    strings = strings.astype(object)
+    strings[special] = [QUOTE + s.replace(QUOTE, 2 * QUOTE) + QUOTE for s in strings[special]]
+    return strings
+
+
+def format_values(values):
+    # Pandas extension arrays (nullable integers, strings...) are handled as objects
+    kind = values.dtype.kind if isinstance(values.dtype, np.dtype) else 'O'
+    if kind in 'biu':
+        return np.asarray(values).astype(str)
+    if kind == 'f':
+        values = np.asarray(values)
+        return np.where(np.isnan(values), '', values.astype(str))
+    if kind == 'U':
+        return quote(np.asarray(values))
+
+    values = np.asarray(values, dtype=object)
+    missing = pd.isna(values)
+    strings = np.empty(values.shape, dtype=object)
+    strings[missing] = ''
+    strings[~missing] = [str(v) for v in values[~missing]]
+    return quote(strings.astype(str))
+
+
+def write_block(out_file, names, block, header):
+    if header:
+        out_file.write(SEP.join(quote(np.array(names, dtype=str)).tolist()) + os.linesep)
+
+    strings = [format_values(values).tolist() for values in block]
+    if len(strings) == 1:
+        # A row made of a single empty field must be quoted, or it would be an empty line
+        strings[0] = [s if s else 2 * QUOTE for s in strings[0]]
+    if strings and strings[0]:
+        out_file.write(os.linesep.join(map(SEP.join, zip(*strings))) + os.linesep)
+
+
+# Columns are (name, values) pairs, values can be sliced by rows
+def write_csv(columns, out_file, block_rows):
+    names = [name for name, _ in columns]
+    n_rows = len(columns[0][1]) if columns else 0
+    fast = all(can_format(values) for _, values in columns)
+
+    for start in range(0, max(n_rows, 1), block_rows):
+        stop = start + block_rows
+        block = [values[start:stop] for _, values in columns]
+        if fast:
+            write_block(out_file, names, block, start == 0)
+        else:
+            df = pd.DataFrame(dict(enumerate(block)), copy=False)
+            df.columns = names
+            df.to_csv(out_file, sep=SEP, index=False, header=start == 0)
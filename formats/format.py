@@ -1,30 +1,71 @@
+import importlib
 from abc import ABC, abstractmethod
+import pandas as pd
 
 
+# Formats are found among the subclasses of Format. Those needing optional packages list them
+#  in 'requires', and are available only if they are installed.
 class Format(ABC):
     extensions = None
+    requires = []
 
+    @classmethod
+    def is_available(cls):
+        try:
+            for module in cls.requires:
+                importlib.import_module(module)
+        except ImportError:
+            return False
+        return True
+
+    # Only the given columns (by name) are read, if any
     @abstractmethod
-    def read(self, filename):
+    def read(self, filename, columns=None):
         pass
 
     @abstractmethod
     def save(self, dataframe, filename):
         pass
 
+    # Columns are (name, values) pairs, whose values can be sliced by rows: formats able to write
+    #  a file incrementally don't need to build the whole DataFrame
+    def save_columns(self, columns, filename):
+        df = pd.DataFrame({i: values[:] for i, (_, values) in enumerate(columns)}, copy=False)
+        df.columns = [name for name, _ in columns]
+        self.save(df, filename)
+
+    # Yields blocks of consecutive rows (None if the file cannot be read). Formats which can't
+    #  be read incrementally return the whole file as a single block.
+    def read_chunks(self, filename, chunk_rows, columns=None):
+        yield self.read(filename, columns)
+
+    # Names of the columns, formats storing them apart from the data don't read the file
+    def read_header(self, filename):
+        df = self.read(filename)
+        return None if df is None else list(df)
+
+
+def get_format_classes(cls=Format):
+    classes = []
+    for sub in cls.__subclasses__():
+        if sub.is_available():
+            classes.append(sub)
+        classes.extend(get_format_classes(sub))
+    return classes
+
 
-def get_format(ext):
-    for cls in Format.__subclasses__():
-        f = cls()
-        if ext in f.extensions:
-            return f
-    return None
+# The longest matching extension wins (e.g. '.csv.gz' over '.gz')
+def get_format(filename):
+    matches = [(len(ext), cls) for cls in get_format_classes() for ext in cls.extensions if filename.endswith(ext)]
+    if not matches:
+        return None
+    return max(matches, key=lambda m: m[0])[1]()
 
 
 def get_all_formats():
     format_list = []
-    for cls in Format.__subclasses__():
-        format_list.extend(cls().extensions)
+    for cls in get_format_classes():
+        format_list.extend(cls.extensions)
     return format_list
 
 
@@ -0,0 +1,61 @@
+import pandas as pd
+from formats.format import Format
+
+KEY = "data"  # key of the table written to new files
+
+
+# HDF5 files written by pandas (PyTables). The first table of the file is used: with the 'table'
+#  layout only the requested columns are read, and the file can be read in blocks of rows.
+class HDF5Format(Format):
+    extensions = ['.h5', '.hdf5']
+    requires = ['tables']
+
+    @staticmethod
+    def get_key(store):
+        keys = store.keys()
+        if not keys:
+            raise ValueError("no tables")
+        return keys[0]
+
+    @staticmethod
+    def select(store, key, columns, start=None, stop=None):
+        storer = store.get_storer(key)
+        if storer.is_table:
+            df = store.select(key, columns=columns, start=start, stop=stop)
+        else:
+            df = store.select(key, start=start, stop=stop)
+            if columns is not None:
+                df = df.iloc[:, [i for i, name in enumerate(df) if name in columns]]
+        df.index = pd.RangeIndex(0 if start is None else start, (0 if start is None else start) + df.shape[0])
+        return df
+
+    def read_header(self, filename):
+        try:
+            with pd.HDFStore(filename, 'r') as store:
+                return list(self.select(store, self.get_key(store), None, 0, 0))
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def read(self, filename, columns=None):
+        try:
+            with pd.HDFStore(filename, 'r') as store:
+                return self.select(store, self.get_key(store), columns)
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def read_chunks(self, filename, chunk_rows, columns=None):
+        try:
+            with pd.HDFStore(filename, 'r') as store:
+                key = self.get_key(store)
+                n_rows = store.get_storer(key).nrows if store.get_storer(key).is_table else None
+                if n_rows is None:
+                    yield self.select(store, key, columns)
+                    return
+
+                for start in range(0, n_rows, chunk_rows):
+                    yield self.select(store, key, columns, start, start + chunk_rows)
+        except (OSError, ValueError, TypeError, KeyError):
+            yield None
+
+    def save(self, dataframe, filename):
+        dataframe.to_hdf(filename, key=KEY, mode='w', format='table')
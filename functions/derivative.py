@@ -1,9 +1,4 @@
-from functions.time_function import TimeFunction
-import pandas as pd
-import numpy as np
-
-SCALE_NAMES = ['Milliseconds', 'Seconds', 'Minutes', 'Hours', 'Days']
-SCALE_VALUES = [0.001, 1.0, 60.0, 3600.0, 86400.0]
+from functions.time_function import TimeFunction, SCALE_NAMES, get_delta, get_scale, difference
 
 
 class Derivative(TimeFunction):
@@ -19,18 +14,6 @@ class Derivative(TimeFunction):
             }
         }
 
-    def process_series(self, ts, param):
-        scale_index = SCALE_NAMES.index(param["Time scale"])
-        scale = SCALE_VALUES[scale_index]
-        dt = self.get_delta(ts.index, scale)
-        derivative = ts.diff() / dt
-        return pd.Series(derivative.values, name=ts.name)
-
-    @staticmethod
-    def get_delta(timestamp, scale):
-        try:
-            t = timestamp.to_series()
-            return t.diff().dt.total_seconds() / scale
-        except (TypeError, AttributeError):
-            return pd.Series(np.ones(len(timestamp)))
-
+    def process_array(self, values, index, param):
+        dt = get_delta(index, get_scale(param))
+        return difference(values, dt)
@@ -1,5 +1,4 @@
-from functions.time_function import TimeFunction
-import pandas as pd
+from functions.time_function import TimeFunction, sliding_mean
 import sys
 
 
@@ -17,17 +16,11 @@ class MovingAverage(TimeFunction):
             }
         }
 
-    def process_series(self, ts, param):
+    def process_array(self, values, index, param):
         size = int(param["Window size"])
-        length = ts.shape[0]
+        length = values.shape[0]
 
         if size < 1 or size > length:
             return None
 
-        average = pd.Series([0] * length, name=ts.name)
-        average[0] = ts[0]
-        for n in range(1, length):
-            step = max(0, n - size)
-            average[n] = average[n - 1] + (ts[n] - ts[step]) / size
-
-        return average
+        return sliding_mean(values, size)
@@ -1,7 +1,15 @@
 import sys
 from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
 
+SCALE_NAMES = ['Milliseconds', 'Seconds', 'Minutes', 'Hours', 'Days']
+SCALE_VALUES = [0.001, 1.0, 60.0, 3600.0, 86400.0]
 
+
+# Functions implement process_array: it receives the values of the series as a float64
+#  ndarray (a view, it must not be modified) and its index, and returns a new ndarray
+#  of the same length (or None if the parameters are not valid).
 class TimeFunction(ABC):
     @abstractmethod
     def get_name(self):
@@ -12,5 +20,52 @@ class TimeFunction(ABC):
         pass
 
     @abstractmethod
-    def process_series(self, ts, param):
+    def process_array(self, values, index, param):
         pass
+
+    def process_series(self, ts, param):
+        try:
+            values = np.asarray(ts.values, dtype=float)
+        except (TypeError, ValueError):
+            return None
+
+        result = self.process_array(values, ts.index, param)
+        if result is None:
+            return None
+        return pd.Series(result, name=ts.name)
+
+
+# VECTORIZED KERNELS
+# Time elapsed between each sample and the previous one (unitary if there is no timestamp)
+def get_delta(index, scale):
+    if not isinstance(index, pd.DatetimeIndex):
+        return np.ones(len(index))
+
+    dt = np.empty(len(index))
+    dt[:1] = np.nan
+    dt[1:] = np.diff(index.values) / np.timedelta64(1, 's') / scale
+    return dt
+
+
+def get_scale(param):
+    return SCALE_VALUES[SCALE_NAMES.index(param["Time scale"])]
+
+
+def difference(values, dt):
+    result = np.empty(len(values))
+    result[:1] = np.nan
+    np.divide(np.diff(values), dt[1:], out=result[1:])
+    return result
+
+
+def cumulative_trapezoid(values, dt):
+    result = np.zeros(len(values))
+    np.cumsum(0.5 * (values[1:] + values[:-1]) * dt[1:], out=result[1:])
+    return result
+
+
+# Trailing mean: the samples before the first one are considered equal to it
+def sliding_mean(values, size):
+    padded = np.concatenate((np.zeros(1), np.full(size - 1, values[0]), values))
+    sums = np.cumsum(padded)
+    return (sums[size:] - sums[:-size]) / size
@@ -1,19 +1,29 @@
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from core import PlotCanvas
 from settings import SettingsWindow
 from functions.controller import FunctionController
+from formats.format import get_all_formats
 import config
 
 
-class ScrollCanvas(QScrollArea):
+# The canvas is as big as the view: the scrollbar moves through the plots, which are drawn
+#  only when they are shown (see PlotCore)
+class ScrollCanvas(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.scrollbar = QScrollBar(Qt.Vertical, self)
+        self.scrollbar.setFixedWidth(18)
 
-        # Fix background glitch by assigning a fixed scrollbar size
-        self.setStyleSheet("QScrollBar:vertical { width: 18px; }\nQScrollArea{ border: none; }")
+        self.box = QHBoxLayout()
+        self.box.setContentsMargins(0, 0, 0, 0)
+        self.box.setSpacing(0)
+        self.box.addWidget(self.scrollbar)
+        self.setLayout(self.box)
+
+    def set_widget(self, widget):
+        self.box.insertWidget(0, widget)
 
     def keyPressEvent(self, event):
         event.ignore()
@@ -99,7 +109,9 @@ class OpeningWindow(QMainWindow):
         self.project_button.resize(450, 100)
 
     def file_dialog(self):
-        files, _ = QFileDialog.getOpenFileNames(self, "Select files", "", "CSV Files (*.csv);;All Files (*)")
+        extensions = " ".join("*" + ext for ext in get_all_formats())
+        file_filter = "Data Files ({});;All Files (*)".format(extensions)
+        files, _ = QFileDialog.getOpenFileNames(self, "Select files", "", file_filter)
         if files:
             self.controller.to_labeler(files=files)
 
@@ -138,8 +150,7 @@ class LabelerWindow(QMainWindow):
         self.plot_canvas = PlotCanvas(self)
         self._menubar()
 
-        self.scroll_canvas.setWidget(self.plot_canvas)
-        self.scroll_canvas.setWidgetResizable(True)
+        self.scroll_canvas.set_widget(self.plot_canvas)
 
         layout = QVBoxLayout()
         layout.setContentsMargins(0, 0, 0, 0)
@@ -227,10 +238,6 @@ class LabelerWindow(QMainWindow):
         self.plot_canvas.quit()
         event.ignore()
 
-    def resizeEvent(self, event):
-        self.plot_canvas.figure_resize()
-        return super(LabelerWindow, self).resizeEvent(event)
-
     def open_settings(self, active=0):
         settings_window = SettingsWindow()
         settings_window.tabs.setCurrentIndex(active)
@@ -256,14 +263,8 @@ class LabelerWindow(QMainWindow):
             func_entry = self.remove_function.addAction(func)
             func_entry.triggered.connect(make_caller(self.open_function_removal, i))
 
-    # TODO: improve
     def update_dimensions(self):
-        # I honestly don't know how this can work, but it apparently does
-        self.centralWidget().setStyleSheet("opacity: 0;")
-        QTimer.singleShot(500, lambda: self.centralWidget().setStyleSheet("opacity: 1;"))
-
         self.plot_canvas.figure_resize()
-        self.scroll_canvas.adjustSize()
 
 
 def make_caller(method, index):
@@ -0,0 +1,201 @@
+import numpy as np
+import pandas as pd
+
+
+# Labels of a file, stored as intervals of rows (both ends included) with the id of their name.
+# Any number of disjoint intervals can share the same label. Dense columns (one per label)
+#  are produced and parsed only when needed by the file format.
+class LabelStore:
+    def __init__(self):
+        self.names = []  # label id -> label name
+        self.ids = np.empty(0, dtype=np.int64)
+        self.starts = np.empty(0, dtype=np.int64)
+        self.ends = np.empty(0, dtype=np.int64)
+        self.order = None  # intervals sorted by start, computed when needed
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    def __getitem__(self, index):
+        return self.names[self.ids[index]], int(self.starts[index]), int(self.ends[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def get_id(self, name):
+        if name not in self.names:
+            self.names.append(name)
+        return self.names.index(name)
+
+    def add(self, name, start, end):
+        self.extend(name, [start], [end])
+
+    def extend(self, name, starts, ends):
+        self.ids = np.concatenate((self.ids, np.full(len(starts), self.get_id(name), dtype=np.int64)))
+        self.starts = np.concatenate((self.starts, np.asarray(starts, dtype=np.int64)))
+        self.ends = np.concatenate((self.ends, np.asarray(ends, dtype=np.int64)))
+        self.order = None
+
+    def remove(self, index):
+        self.ids = np.delete(self.ids, index)
+        self.starts = np.delete(self.starts, index)
+        self.ends = np.delete(self.ends, index)
+        self.order = None
+
+    # Adds an interval merging it with the ones of the same label which overlap or touch it.
+    # Returns the indexes of the merged intervals (removed before adding the new one).
+    def insert(self, name, start, end):
+        merged = self.overlapping(start - 1, end + 1, name)
+        if merged.shape[0] > 0:
+            start = min(start, int(self.starts[merged].min()))
+            end = max(end, int(self.ends[merged].max()))
+            self.remove(merged)
+        self.add(name, start, end)
+        return merged
+
+    # Indexes of the intervals sharing at least a row with [start, end] (optionally of a label only)
+    def overlapping(self, start, end, name=None):
+        if self.order is None:
+            self.order = np.argsort(self.starts, kind='stable')
+
+        k = np.searchsorted(self.starts[self.order], end, side='right')
+        candidates = self.order[:k]
+        mask = self.ends[candidates] >= start
+        if name is not None:
+            mask &= self.ids[candidates] == (self.names.index(name) if name in self.names else -1)
+        return np.sort(candidates[mask])
+
+    # Compact form, used to persist the labels: [[name, start, end], ...]
+    def to_list(self):
+        return [[self.names[i], s, e] for i, s, e in zip(self.ids.tolist(), self.starts.tolist(), self.ends.tolist())]
+
+    @staticmethod
+    def from_list(labels_list):
+        store = LabelStore()
+        if labels_list:
+            names, starts, ends = zip(*labels_list)
+            store.ids = np.array([store.get_id(name) for name in names], dtype=np.int64)
+            store.starts = np.array(starts, dtype=np.int64)
+            store.ends = np.array(ends, dtype=np.int64)
+        return store
+
+    def copy(self):
+        return LabelStore.from_array(self.names, self.to_array())
+
+    # Intervals of the given labels only (e.g. the ones still configured)
+    def select(self, names):
+        kept = np.isin(self.ids, [i for i, name in enumerate(self.names) if name in names])
+        return LabelStore.from_array(self.names, self.to_array()[:, kept])
+
+    # Binary form of the intervals (ids, starts and ends), the names are kept apart
+    def to_array(self):
+        return np.stack((self.ids, self.starts, self.ends))
+
+    @staticmethod
+    def from_array(names, array):
+        store = LabelStore()
+        store.names = list(names)
+        store.ids, store.starts, store.ends = (np.array(row, dtype=np.int64) for row in array)
+        return store
+
+    # A label column flags with 1 the rows of its intervals
+    @staticmethod
+    def from_columns(df, labels):
+        store = LabelStore()
+        store.extend_columns(df, labels, 0)
+        return store
+
+    # Label columns of a block of rows starting at offset: intervals reaching the first
+    #  row of the block are joined to the ones ending on the last row of the previous block
+    def extend_columns(self, df, labels, offset):
+        for i, key in enumerate(list(df)):
+            if key in labels:
+                # Binary formats may keep the '1' of the labels as strings
+                flags = pd.to_numeric(df.iloc[:, i], errors='coerce').to_numpy() == 1.0
+                flags = np.concatenate(([0], flags, [0])).astype(np.int8)
+                edges = np.diff(flags)
+                starts = np.flatnonzero(edges == 1) + offset
+                ends = np.flatnonzero(edges == -1) - 1 + offset
+
+                if starts.shape[0] > 0 and starts[0] == offset and offset > 0:
+                    self.insert(key, int(starts[0]), int(ends[0]))
+                    starts, ends = starts[1:], ends[1:]
+                self.extend(key, starts, ends)
+
+    # Dense column of a label ('1' on the rows of its intervals) for the rows in [start, stop)
+    def get_dense(self, label_id, start, stop):
+        selected = (self.ids == label_id) & (self.starts < stop) & (self.ends >= start)
+        bounds = np.zeros(stop - start + 1, dtype=np.int64)
+        np.add.at(bounds, np.maximum(self.starts[selected], start) - start, 1)
+        np.add.at(bounds, np.minimum(self.ends[selected] + 1, stop) - start, -1)
+        return np.where(np.cumsum(bounds[:-1]) > 0, '1', '')
+
+    # One column for each label which is used, computed only when its rows are written
+    def get_columns(self, n_rows):
+        label_ids = [i for i in range(len(self.names)) if np.any(self.ids == i)]
+        return [(self.names[i], DenseColumn(self, i, n_rows)) for i in label_ids]
+
+
+class DenseColumn:
+    dtype = np.dtype('U1')
+
+    def __init__(self, store, label_id, n_rows):
+        self.store = store
+        self.label_id = label_id
+        self.n_rows = n_rows
+
+    def __len__(self):
+        return self.n_rows
+
+    def __getitem__(self, rows):
+        start, stop, _ = rows.indices(self.n_rows)
+        return self.store.get_dense(self.label_id, start, max(start, stop))
+
+
+# Finds the topmost (last inserted) interval containing a point with a binary search over the
+#  sorted bounds of all the intervals. Lookup tables are rebuilt only after a change.
+class IntervalIndex:
+    def __init__(self):
+        self.x1 = np.empty(0)
+        self.x2 = np.empty(0)
+        self.bounds = None
+        self.on_bound = None  # topmost interval containing bounds[k]
+        self.between = None  # topmost interval containing (bounds[k], bounds[k+1])
+
+    def __len__(self):
+        return self.x1.shape[0]
+
+    def set(self, x1, x2):
+        self.x1 = np.array(x1, dtype=float)
+        self.x2 = np.array(x2, dtype=float)
+        self.bounds = None
+
+    def add(self, x1, x2):
+        self.set(np.append(self.x1, x1), np.append(self.x2, x2))
+
+    def remove(self, index):
+        self.set(np.delete(self.x1, index), np.delete(self.x2, index))
+
+    def build(self):
+        self.bounds = np.unique(np.concatenate((self.x1, self.x2)))
+        self.on_bound = np.full(self.bounds.shape[0], -1)
+        self.between = np.full(self.bounds.shape[0], -1)
+
+        lo = np.searchsorted(self.bounds, self.x1)
+        hi = np.searchsorted(self.bounds, self.x2)
+        for i in range(len(self)):
+            self.on_bound[lo[i]:hi[i] + 1] = i
+            self.between[lo[i]:hi[i]] = i
+
+    def find(self, x):
+        if len(self) == 0:
+            return None
+        if self.bounds is None:
+            self.build()
+
+        k = np.searchsorted(self.bounds, x, side='right') - 1
+        if k < 0:
+            return None
+        i = self.on_bound[k] if self.bounds[k] == x else self.between[k]
+        return None if i < 0 else int(i)
@@ -35,6 +35,9 @@ class ApplicationController:
         self.labeler.show()
 
     def to_opening(self):
+        if not self.labeler.plot_canvas.close_session():
+            return
+        config.end_session()
         self.labeler.destroy()
         self.opening.show()
 
@@ -1,156 +1,236 @@
-import lttb
 import numpy as np
-import pandas as pd
-from matplotlib import patches as p
+from matplotlib.collections import PolyCollection
+from matplotlib.patches import Rectangle
+from matplotlib import transforms
 import matplotlib.dates as mdates
 import matplotlib.ticker as ticker
+from sampler import Sampler
+from downsampling import METHODS, LTTB
 
-N_MAX = 4000
+N_MAX = 4000  # points drawn for each series, unless the plot gives a different number
+CANDIDATES = 4  # points taken from the pyramid for each one drawn, before downsampling them
 
+sampler = Sampler()  # worker pool shared by all the plots
 
+
+# Binary search on the (sorted) values: x can be either a scalar or an array
 def get_nearest_index(x, values):
-    prev = np.inf
-    for i, v in enumerate(values):
-        delta = abs(v - x)
-        if delta < prev:
-            prev = delta
-        else:
-            return i-1
-    return len(values)-1
+    if len(values) < 2:
+        return 0 if np.ndim(x) == 0 else np.zeros(np.shape(x), dtype=int)
+
+    right = np.clip(np.searchsorted(values, x), 1, len(values) - 1)
+    left = right - 1
+    nearest = np.where(x - values[left] <= values[right] - x, left, right)
+    return int(nearest) if np.ndim(x) == 0 else nearest
+
+
+def index_to_date(indexes, timestamp):
+    return timestamp[np.asarray(indexes, dtype=int)]
+
+
+# Rows of the view (one extra on each side lets the lines reach the borders of the plot)
+def get_row_range(xlim, timestamp):
+    a = get_nearest_index(xlim[0], timestamp) if timestamp is not None else int(xlim[0])
+    b = get_nearest_index(xlim[1], timestamp) if timestamp is not None else int(xlim[1])
+    return a - 1, b + 2
+
+
+# Rows (x) are compared by their position in the plot, i.e. their timestamps if there are any
+def downsample(x, y, n_out, method=LTTB, timestamp=None):
+    valid = ~np.isnan(y)
+    x, y = x[valid], y[valid]
+    if x.shape[0] <= n_out:
+        return x, y
+
+    kept = METHODS[method](x if timestamp is None else timestamp[x], y, n_out)
+    return x[kept], y[kept]
+
+
+def sample_series(pyramid, a, b, method=LTTB, timestamp=None, n_out=N_MAX):
+    x, y = pyramid.query(a, b, CANDIDATES * n_out)
+    return downsample(x, y, n_out, method, timestamp) if x.shape[0] > n_out else (x, y)
+
+
+# Points of the same rows of many series (each one with its own method, LTTB by default),
+#  sampled in a single batch by the worker pool
+def sample_range(pyramids, a, b, methods=None, timestamp=None, n_out=N_MAX, pool=None):
+    methods = [LTTB] * len(pyramids) if methods is None else methods
+    return (pool or sampler).map(lambda job: sample_series(job[0], a, b, job[1], timestamp, n_out),
+                                 zip(pyramids, methods))
 
 
 class Plotter:
-    def __init__(self, plot, draw_set, timestamp, norm):
+    # The points of the series can be sampled in advance, together with the ones of other plots
+    def __init__(self, plot, draw_set, pyramids, timestamp, norm, method=LTTB, n_max=N_MAX, point_set=None):
         self.plot = plot
         self.draw_set = draw_set
+        self.pyramids = pyramids  # one for each series, used for downsampling
         self.timestamp = timestamp
         self.normalize = norm
+        self.method = method  # downsampling algorithm
+        self.n_max = n_max  # points drawn for each series
+
+        self.lines = []  # one for each series
+        self.legend_loc = 1
 
-        self.rects = []  # one for each label
-        self.line = self.plot.axvline(x=0, linestyle='dashed', color='black', linewidth=1)
+        # Labels are drawn by a single collection for each color, spanning the whole plot height
+        self.spans = {}  # color -> PolyCollection
+        self.span_x1 = np.empty(0)
+        self.span_x2 = np.empty(0)
+        self.span_colors = np.empty(0, dtype=object)
+        self.span_transform = transforms.blended_transform_factory(self.plot.transData, self.plot.transAxes)
 
-        self.y = 0
-        self.h = 1
+        # Overlay (animated artists): they are not part of the figure and are blitted on top of it
+        self.line = self.plot.axvline(x=0, linestyle='dashed', color='black', linewidth=1, zorder=3, animated=True)
+        self.preview = Rectangle((0, 0), 0, 1, transform=self.span_transform, alpha=0.2, animated=True, visible=False)
+        self.plot.add_artist(self.preview)
 
         if self.is_empty():
             plot.get_yaxis().set_visible(False)
-            self.manage_timestamp() if self.timestamp else None
+            self.manage_timestamp() if self.timestamp is not None else None
         else:
-            self.draw()
+            self.draw(point_set)
 
     def is_empty(self):
         return not self.draw_set
 
     def is_sampled(self):
-        if not self.draw_set:
-            return False
-        return self.draw_set[0].shape[0] > N_MAX
-
-    def add_rect(self, x1, x2, color='C0'):
-        w = x2 - x1
-        new_r = p.Rectangle(xy=(x1, self.y), width=w, height=self.h, color=color, alpha=0.2)
-        self.rects.append(new_r)
-        self.plot.add_patch(new_r)
-
-    def remove_rect(self, index):
-        self.rects[index].remove()
-        del self.rects[index]
-
-    def click_on_rect(self, event):
-        rect_list = []
-        for r in self.rects:
-            rlim = [r.get_x(), r.get_x()+r.get_width()]
-            rect_list.append(rlim[0] <= event.xdata <= rlim[1])  # True if within rect limits
-        return rect_list
-
-    def draw(self):
-        point_set = self.process_series()
-        point_set = [(ts-ts.min())/(ts.max()-ts.min()) for ts in point_set] if self.normalize else point_set
-        point_set = self.insert_timestamp(point_set) if self.timestamp else point_set
-
-        [self.plot.plot(df, label=df.name) for df in point_set]
-        self.manage_timestamp() if self.timestamp else None
-
-        # Moves cursor above the time series
-        self.plot.lines.append(self.plot.lines.pop(0))
-
-        ylim = self.plot.get_ylim()
-        self.h = abs(ylim[1] - ylim[0])
-        self.y = min(ylim)
-
-    def zoom(self, factor):
+        return self.get_rows() > self.n_max
+
+    def get_rows(self):
+        if not self.pyramids:
+            return 0
+        return len(self.pyramids[0])
+
+    def set_spans(self, x1, x2, colors):
+        self.span_x1 = np.array(x1, dtype=float)
+        self.span_x2 = np.array(x2, dtype=float)
+        self.span_colors = np.array(colors, dtype=object)
+        for color in set(self.spans) | set(colors):
+            self.update_spans(color)
+
+    def add_span(self, x1, x2, color='C0'):
+        self.span_x1 = np.append(self.span_x1, x1)
+        self.span_x2 = np.append(self.span_x2, x2)
+        self.span_colors = np.append(self.span_colors, np.array([color], dtype=object))
+        self.update_spans(color)
+
+    def remove_span(self, index):
+        colors = set(np.atleast_1d(self.span_colors[index]))
+        self.span_x1 = np.delete(self.span_x1, index)
+        self.span_x2 = np.delete(self.span_x2, index)
+        self.span_colors = np.delete(self.span_colors, index)
+        for color in colors:
+            self.update_spans(color)
+
+    def update_spans(self, color):
+        selected = self.span_colors == color
+        verts = np.empty((np.count_nonzero(selected), 4, 2))
+        verts[:, :, 0] = np.column_stack([self.span_x1[selected]] * 2 + [self.span_x2[selected]] * 2)
+        verts[:, :, 1] = [0, 1, 1, 0]
+
+        if color not in self.spans:
+            self.spans[color] = PolyCollection([], facecolors=color, edgecolors=color, alpha=0.2,
+                                               transform=self.span_transform)
+            self.plot.add_collection(self.spans[color], autolim=False)
+        self.spans[color].set_verts(verts)
+
+    def draw(self, point_set=None):
+        point_set = self.process_series() if point_set is None else self.normalize_points(point_set)
+        for ts, (x, y) in zip(self.draw_set, point_set):
+            x = self.insert_timestamp(x) if self.timestamp is not None else x
+            self.lines.append(self.plot.plot(x, y, label=ts.name)[0])
+        self.manage_timestamp() if self.timestamp is not None else None
+
+    # New rows have been read: the lines are drawn again and the view fits all of them
+    def extend(self, timestamp, point_set=None):
+        self.timestamp = timestamp
+        if not self.is_empty():
+            self.update_lines(self.process_series() if point_set is None else self.normalize_points(point_set))
+            bounds = [(0, 1) if self.normalize else pyr.get_bounds() for pyr in self.pyramids]
+            lo, hi = min(b[0] for b in bounds), max(b[1] for b in bounds)
+            if hi > lo:
+                self.plot.set_ylim(lo - 0.05 * (hi - lo), hi + 0.05 * (hi - lo))
+
+        if self.timestamp is not None:
+            self.manage_timestamp()
+        elif not self.is_empty():
+            n = self.get_rows() - 1
+            self.plot.set_xlim(-0.05 * n, 1.05 * n)
+
+    # View zoomed around the cursor
+    def get_zoom(self, factor):
         center_on = self.line.get_xdata()[0]
         xlim = self.plot.axes.get_xlim()
         dim = xlim[1] - xlim[0]
 
         new_xlim_min = center_on + (xlim[0] - center_on) / factor
         new_xlim_max = new_xlim_min + dim / factor
+        return new_xlim_min, new_xlim_max
 
-        # Requires special handling if downsampled: not all points can be shown at once
+    def resample(self):
         if self.is_sampled():
-            self.plot.clear()
-            self.line = self.plot.axvline(x=center_on, linestyle='dashed', color='black', linewidth=1)
+            self.update_lines(self.process_zoom(self.plot.get_xlim()))
 
-            zoomed_set = self.process_zoom([new_xlim_min, new_xlim_max])
-            zoomed_set = self.insert_timestamp(zoomed_set) if self.timestamp else zoomed_set
+    def update_lines(self, point_set):
+        for line, (x, y) in zip(self.lines, point_set):
+            line.set_data(self.insert_timestamp(x) if self.timestamp is not None else x, y)
 
-            [self.plot.plot(df) for df in zoomed_set]
-            self.manage_timestamp() if self.timestamp else None
-            self.plot.lines.append(self.plot.lines.pop(0))
-
-        self.plot.set_xlim([new_xlim_min, new_xlim_max])
+    # Returns True if the figure has to be redrawn (the legend has been moved)
+    def move_line(self, xs):
+        self.line.set_xdata(xs)
+        return self.adjust_legend()
 
-    def zoom_out(self):
-        self.zoom(0.5)
+    def set_preview(self, x1=None, x2=None, color='C0'):
+        if x1 is None:
+            self.preview.set_visible(False)
+            return
 
-    def zoom_in(self):
-        self.zoom(2)
+        self.preview.set_x(x1)
+        self.preview.set_width(x2 - x1)
+        self.preview.set_color(color)
+        self.preview.set_visible(True)
 
-    def move_line(self, xs):
-        self.line.set_xdata(xs)
-        self.adjust_legend()
+    def draw_overlay(self):
+        self.plot.draw_artist(self.preview)
+        self.plot.draw_artist(self.line)
 
     def adjust_legend(self):
         if self.is_empty():
-            return
+            return False
         x = self.line.get_xdata()[0]
         xlim = self.plot.get_xlim()
         half = xlim[0] + (xlim[1] - xlim[0])/2
-        if x < half:
-            self.plot.legend(loc=1, prop={'size': 8})
-        else:
-            self.plot.legend(loc=2, prop={'size': 8})
+        loc = 1 if x < half else 2
+
+        if loc == self.legend_loc:
+            return False
+        self.legend_loc = loc
+        self.plot.legend(loc=loc, prop={'size': 8})
+        return True
 
     def process_series(self):
-        n_rows = self.draw_set[0].shape[0]
+        return self.process_range(0, self.get_rows())
 
-        if n_rows <= N_MAX:
-            return self.draw_set
+    def process_zoom(self, xlim):
+        return self.process_range(*get_row_range(xlim, self.timestamp))
 
-        sampled_set = []
-        for ts in self.draw_set:
-            out = lttb.downsample(np.array([ts.index, ts]).T, N_MAX)
-            sampled_set.append(pd.Series(out[:, 1], index=out[:, 0], name=ts.name))
-        return sampled_set
+    def process_range(self, a, b):
+        methods = [self.method] * len(self.pyramids)
+        return self.normalize_points(sample_range(self.pyramids, a, b, methods, self.timestamp, self.n_max))
 
-    def process_zoom(self, xlim):
-        a = get_nearest_index(xlim[0], self.timestamp) if self.timestamp else max(int(xlim[0]), 0)
-        b = get_nearest_index(xlim[1], self.timestamp) if self.timestamp else min(int(xlim[1])+1, len(self.draw_set[0]))
-        zoomed_set = [df.iloc[a:b] for df in self.draw_set]
-
-        if b - a <= N_MAX:
-            return zoomed_set
-
-        sampled_set = []
-        for ts in zoomed_set:
-            out = lttb.downsample(np.array([ts.index, ts]).T, N_MAX)
-            sampled_set.append(pd.Series(out[:, 1], index=out[:, 0], name=ts.name))
-        return sampled_set
-
-    def insert_timestamp(self, point_set):
-        for ts in point_set:
-            ts.index = [self.timestamp[int(i)] for i in ts.index] if self.is_sampled() else self.timestamp
-        return point_set
+    def normalize_points(self, point_set):
+        if not self.normalize:
+            return point_set
+
+        normalized = []
+        for pyr, (x, y) in zip(self.pyramids, point_set):
+            lo, hi = pyr.get_bounds()
+            normalized.append((x, (y - lo) / (hi - lo)))
+        return normalized
+
+    def insert_timestamp(self, x):
+        return index_to_date(x, self.timestamp)
 
     def manage_timestamp(self):
         span = self.timestamp[-1] - self.timestamp[0]
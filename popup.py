@@ -27,6 +27,7 @@ class RightClickMenu(QMenu):
 
         self.plot_set = None
         self.normalize = None
+        self.m4 = None
 
         self.move(QCursor.pos())
         self.init()
@@ -61,6 +62,16 @@ class RightClickMenu(QMenu):
         if self.plot_index in self.normalize:
             normalize_plot.setChecked(True)
 
+        # Min/max sampling (keeps the peaks of each pixel column instead of the LTTB shape)
+        self.m4 = config.get_m4_plots()
+        m4_plot = QAction("Min/max sampling", self)
+        m4_plot.triggered.connect(self.m4_plot)
+        m4_plot.setCheckable(True)
+        self.addAction(m4_plot)
+
+        if self.plot_index in self.m4:
+            m4_plot.setChecked(True)
+
         # Add empty plot (before or after the current)
         self.addSeparator()
         add_menu = self.addMenu("Add plot")
@@ -90,10 +101,12 @@ class RightClickMenu(QMenu):
         self.canvas.core.remove_label(self.click_event)
 
     def action(self, value):
-        data_columns = config.get_datafile().get_data_columns()
+        datafile = config.get_datafile()
+        data_columns = datafile.get_data_columns()
         if data_columns[value] in self.plot_set[self.plot_index]:
             self.plot_set[self.plot_index].remove(data_columns[value])
         else:
+            datafile.load_columns([data_columns[value]])  # columns not plotted so far may not be read yet
             self.plot_set[self.plot_index].append(data_columns[value])
         config.set_plot_info(self.plot_set, self.normalize)
 
@@ -105,15 +118,27 @@ class RightClickMenu(QMenu):
             self.normalize.sort()
         config.set_plot_info(self.plot_set, self.normalize)
 
+    def m4_plot(self):
+        if self.plot_index in self.m4:
+            self.m4.remove(self.plot_index)
+        else:
+            self.m4.append(self.plot_index)
+            self.m4.sort()
+        config.set_m4_plots(self.m4)
+
     def add_before(self):
         self.plot_set.insert(self.plot_index, [])
         self.normalize = [i if i < self.plot_index else i+1 for i in self.normalize[:]]
+        self.m4 = [i if i < self.plot_index else i+1 for i in self.m4[:]]
         config.set_plot_info(self.plot_set, self.normalize)
+        config.set_m4_plots(self.m4)
 
     def add_after(self):
         self.plot_set.insert(self.plot_index + 1, [])
         self.normalize = [i+1 if i > self.plot_index else i for i in self.normalize[:]]
+        self.m4 = [i+1 if i > self.plot_index else i for i in self.m4[:]]
         config.set_plot_info(self.plot_set, self.normalize)
+        config.set_m4_plots(self.m4)
 
     def clear_plot(self):
         self.plot_set[self.plot_index] = []
@@ -123,9 +148,14 @@ class RightClickMenu(QMenu):
         del self.plot_set[self.plot_index]
         self.normalize.remove(self.plot_index) if self.plot_index in self.normalize else None
         self.normalize = [i if i < self.plot_index else i-1 for i in self.normalize[:]]
+        self.m4.remove(self.plot_index) if self.plot_index in self.m4 else None
+        self.m4 = [i if i < self.plot_index else i-1 for i in self.m4[:]]
         config.set_plot_info(self.plot_set, self.normalize)
+        config.set_m4_plots(self.m4)
 
     def reset_all(self):
         self.plot_set = [[i] for i in config.get_datafile().get_data_columns()]
         self.normalize = []
+        self.m4 = []
         config.set_plot_info(self.plot_set, self.normalize)
+        config.set_m4_plots(self.m4)
@@ -0,0 +1,106 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datafile import DataFile
+import delta
+
+
+# Reads the files surrounding the current one on a worker thread, so that they are
+#  already parsed when the user moves to them. Loaded files are kept in memory until
+#  they are taken, they are no longer needed or the memory budget is exceeded.
+class Prefetcher:
+    def __init__(self, budget):
+        self.budget = budget  # bytes
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.RLock()
+        self.loaded = OrderedDict()  # path -> (stamp, future), nearest files first
+        self.sizes = {}  # path -> (stamp, memory usage) of the files read so far
+
+    @staticmethod
+    def get_stamp(path, labels):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns, delta.get_stamp(path), tuple(labels)
+
+    def take(self, path, labels):
+        with self.lock:
+            entry = self.loaded.pop(path, None)
+        if entry is None:
+            return None
+
+        # A file which is still being read is awaited, unless the worker has not started it yet
+        stamp, future = entry
+        if stamp is None or stamp != self.get_stamp(path, labels):
+            future.cancel()
+            return None
+        if future.cancel():
+            return None
+
+        # Errors are not reported here: the file is read again and handled by the caller
+        try:
+            return future.result()
+        except Exception:
+            return None
+
+    # Requests are (path, labels, column selector) tuples, nearest files first. Files which have
+    #  already been read are not read again if they would exceed the budget (they'd be evicted).
+    def prefetch(self, requests):
+        paths = [path for path, _, _ in requests]
+        with self.lock:
+            for path in list(self.loaded):
+                if path not in paths:
+                    self.loaded.pop(path)[1].cancel()
+
+            total = 0
+            for path, labels, select_columns in requests:
+                stamp = self.get_stamp(path, labels)
+                if path in self.sizes and self.sizes[path][0] == stamp:
+                    if total + self.sizes[path][1] > self.budget:
+                        continue
+                    total += self.sizes[path][1]
+
+                if path in self.loaded:
+                    if self.loaded[path][0] == stamp:
+                        continue
+                    self.loaded[path][1].cancel()
+
+                future = self.executor.submit(DataFile, path, labels, select_columns)
+                self.loaded[path] = (stamp, future)
+                future.add_done_callback(self.evict)
+            self.loaded = OrderedDict((path, self.loaded[path]) for path in paths if path in self.loaded)
+
+    # noinspection PyUnusedLocal
+    def evict(self, *args):
+        with self.lock:
+            total = 0
+            for path in list(self.loaded):
+                future = self.loaded[path][1]
+                if not future.done() or future.cancelled() or future.exception() is not None:
+                    continue
+
+                size = future.result().get_memory_usage()
+                self.sizes[path] = (self.loaded[path][0], size)
+                if total + size > self.budget:
+                    del self.loaded[path]
+                else:
+                    total += size
+
+    def shutdown(self):
+        with self.lock:
+            for _, future in self.loaded.values():
+                future.cancel()
+            self.loaded.clear()
+        self.executor.shutdown(wait=False)
+
+
+# Indexes of the files around the current one, nearest first
+def get_neighbours(current, n_files, depth):
+    neighbours = []
+    for step in range(1, depth + 1):
+        for i in [(current + step) % n_files, (current - step) % n_files]:
+            if i != current and i not in neighbours:
+                neighbours.append(i)
+    return neighbours
@@ -0,0 +1,121 @@
+import numpy as np
+
+FACTOR = 8  # number of buckets merged into one at each level
+BLOCK = FACTOR << 17  # candidates reduced at once (bounds temporary memory)
+
+
+# Multi-resolution min/max index of a series: level k stores, for each bucket of
+#  FACTOR^(k+1) rows, the positions of its minimum and maximum values.
+# It is built once in O(n) and any range can then be sampled from the nearest level
+#  in time proportional to the number of returned points.
+class Pyramid:
+    def __init__(self, values):
+        self.buffer = np.asarray(values, dtype=float)  # values are a view of it, it can grow
+        self.values = self.buffer
+        self.levels = []
+        self.bounds = None
+        self.build()
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    # Rows appended while a file is being read: only the last bucket of each level is recomputed
+    def extend(self, values):
+        values = np.asarray(values, dtype=float)
+        n, m = len(self), values.shape[0]
+        if n + m > self.buffer.shape[0]:
+            self.buffer = np.empty(max(2 * n, n + m))
+            self.buffer[:n] = self.values
+        self.buffer[n:n + m] = values
+        self.values = self.buffer[:n + m]
+        self.bounds = None
+        self.build(n)
+
+    # Same values, stored elsewhere (e.g. memory mapped once the whole file has been read)
+    def set_values(self, values):
+        self.buffer = np.asarray(values, dtype=float)
+        self.values = self.buffer
+
+    # Buckets of each level are computed starting from the one containing the given row
+    def build(self, start=0):
+        dtype = np.int32 if len(self) < np.iinfo(np.int32).max else np.int64
+        prev_min = prev_max = None
+        count = len(self)
+        level = 0
+        while count > FACTOR:
+            start = start // FACTOR if level < len(self.levels) else 0
+            new_min = self.reduce(prev_min, start, np.argmin, np.inf, dtype)
+            new_max = self.reduce(prev_max, start, np.argmax, -np.inf, dtype)
+
+            if level < len(self.levels):
+                old_min, old_max = self.levels[level]
+                prev_min = np.concatenate((old_min[:start], new_min))
+                prev_max = np.concatenate((old_max[:start], new_max))
+                self.levels[level] = (prev_min, prev_max)
+            else:
+                prev_min, prev_max = new_min, new_max
+                self.levels.append((prev_min, prev_max))
+            count = prev_min.shape[0]
+            level += 1
+
+    def reduce(self, candidates, first, arg, fill, dtype):
+        count = len(self) if candidates is None else candidates.shape[0]
+        base = first * FACTOR
+        out = np.empty(-(-(count - base) // FACTOR), dtype=dtype)
+
+        for start in range(base, count, BLOCK):
+            stop = min(start + BLOCK, count)
+            if candidates is None:
+                pos = None
+                v = self.values[start:stop]
+            else:
+                pos = candidates[start:stop]
+                v = self.values[pos]
+
+            # NaNs never win, unless the whole bucket is NaN (then the first one is taken)
+            v = np.where(np.isnan(v), fill, v)
+            pad = -len(v) % FACTOR
+            if pad:
+                v = np.concatenate([v, np.full(pad, fill)])
+
+            k = arg(v.reshape(-1, FACTOR), axis=1) + np.arange(0, len(v), FACTOR)
+            out[(start - base) // FACTOR:(start - base) // FACTOR + len(k)] = k + start if pos is None else pos[k]
+        return out
+
+    def get_bounds(self):
+        if self.bounds is None:
+            if self.levels:
+                lo = self.values[self.levels[-1][0]]
+                hi = self.values[self.levels[-1][1]]
+            else:
+                lo = hi = self.values
+            with np.errstate(invalid='ignore'):
+                self.bounds = (np.nanmin(lo), np.nanmax(hi)) if lo.size else (0, 0)
+        return self.bounds
+
+    def query(self, a, b, n_points):
+        a = max(int(a), 0)
+        b = min(int(b), len(self))
+        if b <= a:
+            return np.empty(0, dtype=int), np.empty(0)
+        if b - a <= n_points:
+            return np.arange(a, b), self.values[a:b]
+
+        # Finest level returning (at most two points per bucket) no more than n_points
+        level, size = len(self.levels) - 1, FACTOR ** len(self.levels)
+        for i in range(len(self.levels)):
+            s = FACTOR ** (i + 1)
+            if 2 * (-(-b // s) - a // s) <= n_points:
+                level, size = i, s
+                break
+
+        lo, hi = a // size, -(-b // size)
+        idx_min, idx_max = self.levels[level]
+        idx_min, idx_max = idx_min[lo:hi], idx_max[lo:hi]
+
+        # Points of each bucket are kept in their original order
+        x = np.empty(2 * len(idx_min), dtype=idx_min.dtype)
+        x[0::2] = np.minimum(idx_min, idx_max)
+        x[1::2] = np.maximum(idx_min, idx_max)
+        x = x[np.concatenate(([True], x[1:] != x[:-1]))]
+        return x, self.values[x]
@@ -0,0 +1,23 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+WORKERS = os.cpu_count() or 1
+
+
+# Runs the downsampling of many series on a pool of worker threads. Threads share the memory of
+#  the process, so every worker reads its column (and pyramid) in place: nothing is copied or
+#  serialized, only the few sampled points are returned. Results keep the order of the items.
+class Sampler:
+    def __init__(self, workers=WORKERS):
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+
+    def map(self, function, items):
+        items = list(items)
+        if self.executor is None or len(items) < 2:
+            return [function(item) for item in items]
+        return list(self.executor.map(function, items))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
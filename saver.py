@@ -0,0 +1,62 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Writes files on a worker thread, one at a time and in the order they are requested, so that
+#  saving never blocks the interface. Jobs must work on a snapshot of the data. A job which is
+#  still waiting is replaced by a newer one of the same kind for the same file, as long as no
+#  other job for that file has been requested after it (their order would change).
+class Saver:
+    def __init__(self, logger):
+        self.logger = logger
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+        self.queued = {}  # id -> (path, latest job), not started yet
+        self.last = {}  # path -> (kind, id) of the last job requested
+        self.futures = {}  # path -> last write requested
+        self.count = 0
+
+    def submit(self, path, kind, job):
+        with self.lock:
+            last_kind, last_id = self.last.get(path, (None, None))
+            if last_kind == kind and last_id in self.queued:
+                self.queued[last_id] = (path, job)
+                return
+
+            self.count += 1
+            self.queued[self.count] = (path, job)
+            self.last[path] = (kind, self.count)
+            self.futures[path] = self.executor.submit(self.run, self.count)
+
+    # Errors are logged and kept by the future of the job
+    def run(self, job_id):
+        with self.lock:
+            path, job = self.queued.pop(job_id)
+        try:
+            job()
+        except Exception as e:
+            self.logger.error("Unable to write {}: {}".format(path, e))
+            raise
+
+    # Waits for the writes of a file (or all of them) requested so far.
+    # Returns False if the last write of any of those files failed.
+    def wait(self, path=None):
+        with self.lock:
+            if path is None:
+                futures = list(self.futures.values())
+            else:
+                futures = [self.futures[path]] if path in self.futures else []
+        return all(future.exception() is None for future in futures)
+
+
+# The file is written apart and then renamed, so that it's never left half written
+def replace_file(filename, write):
+    tmp = "{}.tmp{}".format(*os.path.splitext(filename))
+    try:
+        write(tmp)
+        os.replace(tmp, filename)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
@@ -87,22 +87,28 @@ class GeneralTab(QWidget):
         plotting_group = QGroupBox("Plotting")
         global_group.setStyleSheet("QGroupBox QWidget { margin: 15px; }")
 
-        # Global settings (Autosave)
+        # Global settings (Autosave, column store)
         self.autosave = QCheckBox("Autosave")
         self.autosave.setChecked(config.get_autosave())
+        self.binary_cache = QCheckBox("Column store")
+        self.binary_cache.setChecked(config.get_binary_cache())
+        self.binary_cache.setToolTip("Keep the opened files on disk as memory-mapped columns: they load faster and need less memory")
 
         gg_layout = QVBoxLayout()
         gg_layout.addWidget(self.autosave)
+        gg_layout.addWidget(self.binary_cache)
         gg_layout.addWidget(spacer_widget(QSizePolicy.Minimum, QSizePolicy.Expanding))
         global_group.setLayout(gg_layout)
 
-        # Plot settings (height/number of simultaneous subplots)
+        # Plot settings (height/number of simultaneous subplots, resolution of the series)
         self.plot_height = QSlider(Qt.Horizontal)
         self.plot_number = QSpinBox()
+        self.points_per_pixel = QDoubleSpinBox()
 
         pg_layout = QFormLayout()
         pg_layout.addRow("Plots height", self.plot_height)
         pg_layout.addRow("Max simultaneous plots   ", self.plot_number)
+        pg_layout.addRow("Points per pixel", self.points_per_pixel)
         plotting_group.setLayout(pg_layout)
 
         current_height = int(config.get_plot_height() * 100)
@@ -114,6 +120,13 @@ class GeneralTab(QWidget):
         self.plot_number.setStyleSheet("margin-left: 110px")
         self.height_change()
 
+        self.points_per_pixel.setRange(0.5, 16)
+        self.points_per_pixel.setSingleStep(0.5)
+        self.points_per_pixel.setDecimals(1)
+        self.points_per_pixel.setValue(config.get_points_per_pixel())
+        self.points_per_pixel.setStyleSheet("margin-left: 110px")
+        self.points_per_pixel.setToolTip("Points drawn for each pixel across a plot: more show the details of big series, less draw faster")
+
         # noinspection PyUnresolvedReferences
         self.plot_height.valueChanged.connect(self.height_change)
         self.plot_number.valueChanged.connect(self.number_change)
@@ -137,8 +150,11 @@ class GeneralTab(QWidget):
 
     def apply(self):
         autosave = self.autosave.isChecked()
+        binary_cache = self.binary_cache.isChecked()
         plot_h = self.plot_height.value() / 100
-        config.set_tsl_config(autosave=autosave, plot_height=plot_h)
+        points_per_pixel = self.points_per_pixel.value()
+        config.set_tsl_config(autosave=autosave, plot_height=plot_h, binary_cache=binary_cache,
+                              points_per_pixel=points_per_pixel)
 
     def height_change(self):
         height = self.plot_height.value()